@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Render pipeline benchmark for network-topo-generator.py
+
+Builds leaf/spine fabrics of increasing size and compares the time to
+produce the SVG/PNG/PDF outputs and the HTML page three ways:
+
+  legacy    dot.render() once per format (a full layout each time), then the
+            SVG is read back from disk for the HTML page
+  two-pass  one dot -Tdot layout, the formats rendered concurrently from the
+            positioned graph with neato -n2
+  pipeline  write_rendered(): one dot run with a -T<fmt> -o <file> pair per
+            format, the SVG kept in memory
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import network_topo_generator as ntg  # noqa: E402
+
+DEFAULT_LEAVES = '4,16,64'
+
+
+def leaf_spine(leaves, spines=4, servers=24):
+    """Switch data of a leaf/spine fabric where both ends of every uplink report it"""
+    switch_data = {}
+    for spine in range(1, spines + 1):
+        switch_data[f"spine{spine}"] = [
+            ntg.Interface(f"swp{leaf}", "up", "up", "100G", "9216", "eth", f"r{leaf}-leaf", f"swp{48 + spine}")
+            for leaf in range(1, leaves + 1)]
+    for leaf in range(1, leaves + 1):
+        rows = [ntg.Interface(f"swp{port}", "up", "up", "25G", "9216", "eth", f"r{leaf}-srv{port}", "eth0")
+                for port in range(1, servers + 1)]
+        rows += [ntg.Interface(f"swp{48 + spine}", "up", "up", "100G", "9216", "eth", f"spine{spine}", f"swp{leaf}")
+                 for spine in range(1, spines + 1)]
+        switch_data[f"r{leaf}-leaf"] = rows
+    return switch_data
+
+
+def legacy(dot, base, formats):
+    """The render path before the pipeline: one dot.render() per format"""
+    dot.format = 'svg'
+    svg_path = dot.render(base, view=False)
+    for fmt in formats[1:]:
+        dot.format = fmt
+        dot.render(f"{base}_{fmt}", view=False)
+    with open(svg_path, 'r') as f:
+        return f.read()
+
+
+def two_pass(dot, base, formats):
+    """The first layout-once path: dot -Tdot, then neato -n2 per format"""
+    from concurrent.futures import ThreadPoolExecutor
+    graphviz = ntg._graphviz()
+    positioned = graphviz.pipe('dot', 'dot', dot.source.encode())
+    with ThreadPoolExecutor(max_workers=len(formats)) as executor:
+        rendered = dict(zip(formats, executor.map(
+            lambda fmt: graphviz.pipe('neato', fmt, positioned, neato_no_op=2), formats)))
+    for fmt, data in rendered.items():
+        with open(base + ("." if fmt == 'svg' else f"_{fmt}.") + fmt, 'wb') as f:
+            f.write(data)
+    return rendered['svg'].decode('utf-8')
+
+
+def pipeline(dot, base, formats):
+    _, svg = ntg.write_rendered(dot, base, formats)
+    return svg.decode('utf-8')
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the legacy, two-pass and single dot run render paths')
+    parser.add_argument('--leaves', default=DEFAULT_LEAVES, help=f'Comma separated leaf counts (default: {DEFAULT_LEAVES})')
+    parser.add_argument('--spines', type=int, default=4, help='Spine switches (default: 4)')
+    parser.add_argument('--servers', type=int, default=24, help='Server ports per leaf (default: 24)')
+    parser.add_argument('--formats', default='svg,png,pdf', help='Formats to render, svg first (default: svg,png,pdf)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions, best time is reported (default: 3)')
+    parser.add_argument('-o', '--output', help='Save the results as JSON')
+    args = parser.parse_args()
+
+    formats = args.formats.split(',')
+    if formats[0] != 'svg':
+        parser.error('--formats must start with svg')
+
+    results = []
+    print(f"{'leaves':>8} {'ports':>8} {'legacy':>12} {'two-pass':>12} {'pipeline':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory(prefix='topo-bench-') as work_dir:
+        for leaves in [int(n) for n in args.leaves.split(',')]:
+            topology = ntg.Topology.from_switch_data(leaf_spine(leaves, args.spines, args.servers))
+            dot = ntg.build_dot(topology, dark=False, grouped=True)
+            base = os.path.join(work_dir, f"fabric-{leaves}")
+            old = best_of(args.repeat, legacy, dot, base, formats)
+            two = best_of(args.repeat, two_pass, dot, base, formats)
+            new = best_of(args.repeat, pipeline, dot, base, formats)
+            results.append({'leaves': leaves, 'ports': len(topology.ports), 'links': len(topology.links),
+                            'legacy': old, 'two_pass': two, 'pipeline': new})
+            print(f"{leaves:>8} {len(topology.ports):>8} {old * 1000:>9.1f} ms {two * 1000:>9.1f} ms "
+                  f"{new * 1000:>9.1f} ms {old / new if new else 0:>7.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'formats': formats, 'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Stage benchmark for network-topo-generator.py
+
+Generates synthetic fabrics of increasing size with gen_fabric.py and
+measures the stages of a run on each of them: parsing the dumps (serially
+and through a cold and a warm parse cache), building the topology model and
+the DOT graph, the dot layout, the SVG to HTML copy and the CSV write. Every
+stage reports its best wall time and its peak RSS; the layout also reports
+the peak RSS of the dot process. Each size runs in a fresh process so the
+memory figures of one size do not leak into the next. --startup also times
+fresh interpreters importing the module and running --help, and lists the
+heavy dependencies a plain import pulls in. Results can be saved as JSON and
+compared against a stored baseline to catch regressions.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+import network_topo_generator as ntg  # noqa: E402
+from gen_fabric import generate_fabric  # noqa: E402
+
+DEFAULT_SIZES = '48,1000,10000,50000'
+STAGES = ['parse', 'ingest_cold', 'ingest_warm', 'model', 'dot', 'layout', 'html', 'csv']
+# Fresh interpreters timed by --startup: a bare one, a plain import and --help
+MODULE = 'network_topo_generator'
+STARTUP_COMMANDS = {
+    'interpreter': ['-c', 'pass'],
+    'import': ['-c', f'import {MODULE}'],
+    'help': [os.path.join(BENCH_DIR, '..', 'network-topo-generator.py'), '--help'],
+}
+# Optional heavy dependencies that a plain import should leave alone
+HEAVY_MODULES = ['graphviz', 'asyncio', 'webbrowser', 'multiprocessing', 'concurrent.futures']
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak RSS of this process, False where the kernel does not allow it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """Peak RSS of this process in KiB"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # Never reset, so only the peak of the whole run so far
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_stages(root, work_dir, jobs, repeat, do_layout):
+    """Measure every stage on one fabric
+
+    Returns:
+        (switches, ports, links, {stage: {'seconds': best wall time, 'peak_rss_kib': peak RSS}})
+    """
+    paths = ntg.batch_files(root)
+    stages = {}
+
+    def measure(stage, setup, func):
+        best = None
+        reset_peak_rss()
+        for _ in range(repeat):
+            arg = setup()
+            start = time.perf_counter()
+            result = func(arg)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        stages[stage] = {'seconds': best, 'peak_rss_kib': peak_rss()}
+        return result
+
+    def parse(_):
+        switch_data = {}
+        for path in paths:
+            with ntg.open_dump(path) as f:
+                switch_data[ntg.switch_name(path)] = ntg.parse_interfaces(f.read())
+        return switch_data
+
+    cache_dir = os.path.join(work_dir, 'cache')
+
+    def cold_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return ntg.ParseCache(cache_dir)
+
+    def ingest(cache):
+        switch_data, _ = ntg.ingest(paths, jobs, cache)
+        cache.save()
+        return switch_data
+
+    switch_data = measure('parse', lambda: None, parse)
+    measure('ingest_cold', cold_cache, ingest)
+    measure('ingest_warm', lambda: ntg.ParseCache(cache_dir), ingest)
+    topology = measure('model', lambda: switch_data, ntg.Topology.from_switch_data)
+
+    def build_dot(topology):
+        dot = ntg.build_dot(topology, dark=False, grouped=True)
+        # The statements are only joined into the DOT text when the source is read
+        dot.source
+        return dot
+
+    # Keep the one-off lazy import of graphviz out of the dot stage
+    ntg._graphviz()
+    dot = measure('dot', lambda: topology, build_dot)
+    if do_layout:
+        children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        svg = measure('layout', lambda: dot, lambda d: ntg.render_formats(d, ['svg'])['svg'])
+        # The layout runs in a dot child process. RUSAGE_CHILDREN only keeps the largest child,
+        # so the dot peak is known when it beats the ingest pool workers and None otherwise
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        stages['layout']['child_peak_rss_kib'] = peak if peak > children_peak else None
+        flagged = ntg.flagged_links(topology)
+        measure('html', lambda: os.path.join(work_dir, 'fabric.html'),
+                lambda path: ntg.write_html(path, svg, False, flagged=flagged))
+    measure('csv', lambda: os.path.join(work_dir, 'fabric.csv'), lambda path: ntg.write_csv(topology, path))
+    return len(topology.switches), len(topology.ports), len(topology.links), stages
+
+
+def _run_size(root, work_dir, jobs, repeat, do_layout):
+    """Run the stages of one size in a fresh process so its peak RSS starts from a clean slate"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run_stages, root, work_dir, jobs, repeat, do_layout).result()
+
+
+def measure_startup(repeat):
+    """Time fresh interpreters importing the module and running --help
+
+    A first untimed import writes the bytecode cache, so the numbers are
+    those of an installed tool rather than of the first run after an edit.
+
+    Returns:
+        {'seconds': {command: best wall time}, 'heavy_modules': [HEAVY_MODULES loaded by the import]}
+    """
+    import subprocess
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.join(BENCH_DIR, '..'), env.get('PYTHONPATH')]))
+
+    def best_of(argv):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *argv], env=env, stdout=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    subprocess.run([sys.executable, *STARTUP_COMMANDS['import']], env=env, check=True)
+    seconds = {name: best_of(argv) for name, argv in STARTUP_COMMANDS.items()}
+    code = f"import sys, {MODULE}; print('\\n'.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    loaded = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return {'seconds': seconds, 'heavy_modules': loaded.stdout.split()}
+
+
+def print_startup(startup):
+    """Print the startup timings and their overhead over a bare interpreter"""
+    bare = startup['seconds']['interpreter']
+    print()
+    for name, seconds in startup['seconds'].items():
+        extra = '' if name == 'interpreter' else f" (+{(seconds - bare) * 1000:.1f} ms)"
+        print(f"{name:<12} {seconds * 1000:>8.1f} ms{extra}")
+    print(f"Heavy modules loaded by the import: {', '.join(startup['heavy_modules']) or 'none'}")
+
+
+def run(args):
+    """Generate the fabrics and benchmark them
+
+    Returns:
+        Results document
+    """
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if not args.no_layout and shutil.which('dot') is None:
+        print("Graphviz executable 'dot' not found, skipping the layout and html stages", file=sys.stderr)
+        args.no_layout = True
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'jobs': jobs,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'ports_per_switch': args.ports_per_switch,
+            'links': args.links,
+            'sites': args.sites,
+            'down': args.down,
+            'max_layout_ports': None if args.no_layout else args.max_layout_ports,
+            'peak_rss_resettable': reset_peak_rss(),
+        },
+        'sizes': [],
+    }
+
+    base_dir = args.work_dir or tempfile.mkdtemp(prefix='topo-bench-')
+    try:
+        for ports in [int(size) for size in args.sizes.split(',')]:
+            switches = max(1, ports // args.ports_per_switch)
+            root = os.path.join(base_dir, f"fabric-{ports}-p{args.ports_per_switch}-l{args.links}"
+                                          f"-s{args.sites}-d{args.down}-seed{args.seed}")
+            if not os.path.isdir(root):
+                print(f"Generating {switches} switches x {args.ports_per_switch} ports...", file=sys.stderr)
+                generate_fabric(root, switches=switches, ports=args.ports_per_switch, links=args.links,
+                                sites=args.sites, down=args.down, seed=args.seed)
+            do_layout = not args.no_layout and ports <= args.max_layout_ports
+            if not do_layout and not args.no_layout:
+                print(f"Skipping layout and html above {args.max_layout_ports} ports", file=sys.stderr)
+            print(f"Benchmarking {ports} ports...", file=sys.stderr)
+            work_dir = os.path.join(base_dir, f"work-{ports}")
+            os.makedirs(work_dir, exist_ok=True)
+            switches, port_count, links, stages = _run_size(root, work_dir, jobs, args.repeat, do_layout)
+            results['sizes'].append({
+                'ports': ports,
+                'switches': switches,
+                'nodes': port_count,
+                'links': links,
+                'stages': stages,
+            })
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    if args.startup:
+        print("Timing startup...", file=sys.stderr)
+        results['startup'] = measure_startup(args.repeat)
+    return results
+
+
+def print_results(results):
+    """Print a table of the stage timings in milliseconds and peak RSS in MiB"""
+    stages = [stage for stage in STAGES if any(stage in size['stages'] for size in results['sizes'])]
+    print(f"{'ports':>8} {'links':>8} " + ' '.join(f"{stage:>20}" for stage in stages))
+    for size in results['sizes']:
+        cells = []
+        for stage in stages:
+            measured = size['stages'].get(stage)
+            cell = '-' if measured is None else \
+                f"{measured['seconds'] * 1000:.1f} ms {measured['peak_rss_kib'] / 1024:.0f} MiB"
+            cells.append(f"{cell:>20}")
+        print(f"{size['ports']:>8} {size['links']:>8} " + ' '.join(cells))
+        dot_peak = size['stages'].get('layout', {}).get('child_peak_rss_kib')
+        if dot_peak:
+            print(f"{'':>17} dot peak RSS {dot_peak / 1024:.0f} MiB")
+
+
+def compare(results, baseline, threshold, min_time, min_rss):
+    """Compare results with a baseline and print the changes
+
+    Returns:
+        List of (ports, stage, metric, baseline value, current value) regressions
+    """
+    differing = sorted(key for key, value in results['meta'].items() if baseline['meta'].get(key) != value)
+    if differing:
+        print(f"Warning: baseline was recorded with different settings: {', '.join(differing)}", file=sys.stderr)
+
+    base_sizes = {size['ports']: size for size in baseline['sizes']}
+    regressions = []
+    print(f"\n{'ports':>8} {'stage':<12} {'metric':<8} {'baseline':>12} {'current':>12} {'change':>8}")
+    for size in results['sizes']:
+        base = base_sizes.get(size['ports'])
+        if base is None:
+            continue
+        for stage in STAGES:
+            if stage not in size['stages'] or stage not in base['stages']:
+                continue
+            old_stage, new_stage = base['stages'][stage], size['stages'][stage]
+            for metric, key, scale, unit, floor in (('time', 'seconds', 1000, 'ms', min_time),
+                                                    ('rss', 'peak_rss_kib', 1 / 1024, 'MiB', min_rss)):
+                old, new = old_stage[key], new_stage[key]
+                change = (new - old) / old if old else 0.0
+                # Ignore stages too fast or too small to be measured reliably
+                regressed = change > threshold and new >= floor
+                if regressed:
+                    regressions.append((size['ports'], stage, metric, old, new))
+                print(f"{size['ports']:>8} {stage:<12} {metric:<8} {old * scale:>9.1f} {unit:<3}"
+                      f"{new * scale:>9.1f} {unit:<3}{change * 100:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    if 'startup' in results and 'startup' in baseline:
+        for command in ('import', 'help'):
+            old, new = baseline['startup']['seconds'][command], results['startup']['seconds'][command]
+            change = (new - old) / old if old else 0.0
+            regressed = change > threshold and new >= min_time
+            if regressed:
+                regressions.append(('startup', command, 'time', old, new))
+            print(f"{'startup':>8} {command:<12} {'time':<8} {old * 1000:>9.1f} {'ms':<3}{new * 1000:>9.1f} {'ms':<3}"
+                  f"{change * 100:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of network-topo-generator.py')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'Comma separated fabric sizes in ports (default: {DEFAULT_SIZES})')
+    parser.add_argument('-p', '--ports-per-switch', type=int, default=48, help='Ports per switch (default: 48)')
+    parser.add_argument('--links', type=float, default=0.5, help='Fraction of ports cabled to another switch (default: 0.5)')
+    parser.add_argument('--sites', type=int, default=2, help='Number of sites (default: 2)')
+    parser.add_argument('--down', type=float, default=0.05, help='Fraction of ports that are down (default: 0.05)')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='Processes for the ingest stages (0 = one per CPU, default: 0)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions, best time is reported (default: 3)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the fabrics (default: 1)')
+    parser.add_argument('--max-layout-ports', type=int, default=10000, help='Skip the layout and html stages above this size (default: 10000)')
+    parser.add_argument('--no-layout', action='store_true', help='Skip the layout and html stages')
+    parser.add_argument('--work-dir', help='Keep generated fabrics in this directory and reuse them across runs')
+    parser.add_argument('--startup', action='store_true', help='Also time the import and --help in fresh interpreters')
+    parser.add_argument('-o', '--output', help='Save the results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare with the results saved in BASELINE')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Slowdown or growth flagged as a regression (default: 0.2 = 20%%)')
+    parser.add_argument('--min-time', type=float, default=0.005, help='Ignore stages faster than this many seconds (default: 0.005)')
+    parser.add_argument('--min-rss', type=int, default=65536, help='Ignore peak RSS below this many KiB (default: 65536)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    print_results(results)
+    if 'startup' in results:
+        print_startup(results['startup'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_time, args.min_rss)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold * 100:.0f}%", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for ssh to exercise the --collect mode without switches
+
+Accepts ssh-style arguments ([options] host command), ignores the options
+and prints the dump of the host from FAKE_SSH_DIR (<host>.txt or
+<host>.txt.gz, default: current directory). Environment variables simulate
+a misbehaving fabric:
+
+  FAKE_SSH_DELAY  seconds to wait before answering (default: 0)
+  FAKE_SSH_FAIL   comma separated hosts that always refuse the connection
+  FAKE_SSH_FLAKY  comma separated hosts that fail their first attempt only
+  FAKE_SSH_HANG   comma separated hosts that never answer
+
+Example:
+  python network-topo-generator.py --collect inventory.txt --ssh 'python3 benchmarks/fake_ssh.py' -o fabric
+"""
+
+import os
+import sys
+import gzip
+import time
+
+# ssh options that take a value
+VALUE_OPTIONS = set('bcDEeFIiJLlmOopQRSWw')
+
+
+def _hosts(variable):
+    return set(filter(None, os.environ.get(variable, '').split(',')))
+
+
+def main():
+    args = sys.argv[1:]
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option[1:] in VALUE_OPTIONS and args:
+            args.pop(0)
+    if not args:
+        print('usage: fake_ssh.py [options] host command', file=sys.stderr)
+        sys.exit(255)
+    host = args[0].split('@')[-1]
+    dump_dir = os.environ.get('FAKE_SSH_DIR', '.')
+
+    time.sleep(float(os.environ.get('FAKE_SSH_DELAY', '0')))
+    if host in _hosts('FAKE_SSH_HANG'):
+        time.sleep(3600)
+    if host in _hosts('FAKE_SSH_FAIL'):
+        print(f'ssh: connect to host {host} port 22: Connection refused', file=sys.stderr)
+        sys.exit(255)
+    if host in _hosts('FAKE_SSH_FLAKY'):
+        marker = os.path.join(dump_dir, f'.flaky-{host}')
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            print(f'ssh: connect to host {host} port 22: Connection timed out', file=sys.stderr)
+            sys.exit(255)
+
+    for name, opener in ((f'{host}.txt', open), (f'{host}.txt.gz', gzip.open)):
+        path = os.path.join(dump_dir, name)
+        if os.path.exists(path):
+            with opener(path, 'rt') as f:
+                sys.stdout.write(f.read())
+            return
+    print(f'ssh: Could not resolve hostname {host}: Name or service not known', file=sys.stderr)
+    sys.exit(255)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic switch dump generator
+
+Writes one <switch>.txt interface table per switch in the format
+network-topo-generator.py reads. Switches are spread over sites
+(site<N>-sw<M>, so extract_site() groups them), a share of their ports is
+cabled to ports of other switches (mostly within the same site) and both
+ends of every cable report it. The other ports face servers or are unused.
+The same arguments and seed always produce the same fabric, so benchmark
+runs are comparable.
+"""
+
+import os
+import sys
+import random
+import argparse
+
+COLUMNS = [('Interface', 11), ('Admin', 7), ('Oper', 6), ('Speed', 7), ('MTU', 6), ('Type', 6),
+           ('Remote Host', 22), ('Remote Port', 11)]
+HEADER = ''.join(f"{title:<{width}}" for title, width in COLUMNS).rstrip()
+SEPARATOR = ''.join(f"{'-' * (width - 2):<{width}}" for _, width in COLUMNS).rstrip()
+
+
+def _row(port, oper, speed, mtu, remote_host='', remote_port=''):
+    return f"{port:<11}{'up':<7}{oper:<6}{speed:<7}{mtu:<6}{'eth':<6}{remote_host:<22}{remote_port}".rstrip()
+
+
+def generate_fabric(root, switches=16, ports=48, links=0.5, sites=2, down=0.05, servers=0.3,
+                    cross_site=0.1, seed=1):
+    """Write a synthetic fabric of switch dumps to root
+
+    Args:
+        root: Directory to write the <switch>.txt dumps to
+        switches: Number of switches
+        ports: Ports per switch
+        links: Fraction of ports cabled to another switch
+        sites: Number of sites the switches are spread over
+        down: Fraction of ports whose oper state is down
+        servers: Fraction of the remaining ports facing a server
+        cross_site: Fraction of switch-to-switch cables between two sites
+        seed: Random seed
+
+    Returns:
+        Number of ports written
+    """
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    names = [f"site{idx % sites + 1}-sw{idx + 1}" for idx in range(switches)]
+    by_site = {}
+    for name in names:
+        by_site.setdefault(name.split('-')[0], []).append(name)
+
+    # Every port starts free; cables pair up free ports of two different switches
+    free = {name: list(range(1, ports + 1)) for name in names}
+    for name in names:
+        rng.shuffle(free[name])
+    peers = {}
+    wanted = int(switches * ports * links / 2)
+    for _ in range(wanted):
+        a = rng.choice(names)
+        if not free[a]:
+            continue
+        pool = names if len(by_site) > 1 and rng.random() < cross_site else by_site[a.split('-')[0]]
+        b = rng.choice(pool)
+        if b == a or not free[b]:
+            continue
+        port_a, port_b = free[a].pop(), free[b].pop()
+        peers[(a, port_a)] = (b, port_b)
+        peers[(b, port_b)] = (a, port_a)
+
+    written = 0
+    for name in names:
+        rows = [HEADER, SEPARATOR]
+        for port in range(1, ports + 1):
+            oper = 'down' if rng.random() < down else 'up'
+            peer = peers.get((name, port))
+            if peer is not None:
+                rows.append(_row(f"swp{port}", oper, '100G', '9216', peer[0], f"swp{peer[1]}"))
+            elif rng.random() < servers:
+                rows.append(_row(f"swp{port}", oper, '25G', '9216', f"{name}-srv{port}", 'eth0'))
+            else:
+                rows.append(_row(f"swp{port}", oper, '', '1500'))
+            written += 1
+        with open(os.path.join(root, f"{name}.txt"), 'w') as f:
+            f.write('\n'.join(rows) + '\n')
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic switch dumps')
+    parser.add_argument('root', help='Directory to write the dumps to (must not exist)')
+    parser.add_argument('-s', '--switches', type=int, default=16, help='Number of switches (default: 16)')
+    parser.add_argument('-p', '--ports', type=int, default=48, help='Ports per switch (default: 48)')
+    parser.add_argument('--links', type=float, default=0.5, help='Fraction of ports cabled to another switch (default: 0.5)')
+    parser.add_argument('--sites', type=int, default=2, help='Number of sites (default: 2)')
+    parser.add_argument('--down', type=float, default=0.05, help='Fraction of ports that are down (default: 0.05)')
+    parser.add_argument('--servers', type=float, default=0.3, help='Fraction of other ports facing servers (default: 0.3)')
+    parser.add_argument('--cross-site', type=float, default=0.1, help='Fraction of cables between sites (default: 0.1)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.root):
+        print(f"Error: {args.root} already exists", file=sys.stderr)
+        sys.exit(1)
+    written = generate_fabric(args.root, switches=args.switches, ports=args.ports, links=args.links,
+                              sites=args.sites, down=args.down, servers=args.servers,
+                              cross_site=args.cross_site, seed=args.seed)
+    print(f"Wrote {written} ports on {args.switches} switches to {args.root}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
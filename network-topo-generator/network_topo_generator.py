@@ -0,0 +1,1635 @@
+import io
+import os
+import re
+import sys
+import csv
+import glob
+import gzip
+import json
+import time
+import shlex
+import sqlite3
+import stat
+import hashlib
+import argparse
+from bisect import bisect_right
+from collections import namedtuple
+from contextlib import nullcontext
+from datetime import datetime
+from html import escape as html_escape
+from shutil import which
+
+VERSION = "13"
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = ".topo-cache"
+
+def check_graphviz_installed() -> bool:
+    return which("dot") is not None
+
+
+def _silent(message: str):
+    """Default progress callback of the library functions: report nothing"""
+
+
+def _graphviz():
+    # Imported on first use, so parsing and the model work without the graphviz package
+    import graphviz
+    return graphviz
+
+
+def extract_site(name: str) -> str:
+    return name.split("-")[0] if "-" in name else "default"
+
+
+
+Interface = namedtuple("Interface", ["interface", "admin", "oper", "speed", "mtu", "type",
+                                     "remote_host", "remote_port"])
+
+# Header column titles -> Interface fields
+HEADER_FIELDS = {
+    "interface": "interface",
+    "admin": "admin",
+    "oper": "oper",
+    "speed": "speed",
+    "mtu": "mtu",
+    "type": "type",
+    "remote host": "remote_host",
+    "remote port": "remote_port",
+}
+
+SEPARATOR_RE = re.compile(r'-{5,}')
+HEADER_COLUMN_RE = re.compile(r'\S+(?: \S+)*')
+FIELD_SPLIT_RE = re.compile(r'\s{2,}')
+
+
+def header_columns(header: str):
+    """Return [(start offset, field)] for the columns of an Interface header line"""
+    columns = []
+    for match in HEADER_COLUMN_RE.finditer(header):
+        columns.append((match.start(), HEADER_FIELDS.get(match.group().lower())))
+    return columns
+
+
+def slice_row(line: str, columns):
+    """Cut a row at the header's column offsets
+
+    A value wider than its column pushes the cut to the end of the value, so
+    overlong fields don't bleed into the next column and empty fields stay empty.
+    """
+    values = {}
+    start = columns[0][0]
+    for idx, (_, field) in enumerate(columns):
+        if idx + 1 < len(columns):
+            end = max(columns[idx + 1][0], start)
+            while 0 < end < len(line) and not line[end - 1].isspace() and not line[end].isspace():
+                end += 1
+        else:
+            end = len(line)
+        if field:
+            values[field] = line[start:end].strip()
+        start = end
+    return Interface(**{field: values.get(field, "") for field in Interface._fields})
+
+
+def split_row(line: str):
+    """Fallback for rows without a header: split on runs of 2+ spaces"""
+    fields = FIELD_SPLIT_RE.split(line.strip())
+    if len(fields) < 6:
+        return None
+    fields = fields[:len(Interface._fields)]
+    return Interface(*fields, *[""] * (len(Interface._fields) - len(fields)))
+
+
+def iter_interfaces(lines):
+    """Yield an Interface per row of a switch interface dump, reading it line by line"""
+    columns = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if not stripped or SEPARATOR_RE.match(stripped):
+            continue
+        if stripped.startswith("Interface"):
+            columns = header_columns(line)
+            continue
+        if columns is None:
+            iface = split_row(line)
+        else:
+            iface = slice_row(line, columns)
+            if not iface.interface or not any(iface[1:]):
+                iface = None
+        if iface is not None:
+            yield iface
+
+
+def open_dump(path: str):
+    """Open a dump for reading: a file, a .gz file or '-' for stdin"""
+    if path == "-":
+        return nullcontext(sys.stdin)
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', errors='replace')
+    return open(path, 'r', errors='replace')
+
+
+def parse_dump(path: str):
+    with open_dump(path) as f:
+        return list(iter_interfaces(f))
+
+
+def parse_interfaces(text: str):
+    return list(iter_interfaces(io.StringIO(text)))
+
+
+def switch_name(path: str) -> str:
+    name = os.path.basename(path)
+    for ext in (".gz", ".txt"):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return name
+
+
+def _hashed_lines(path: str, digest):
+    """Yield the decoded lines of a dump while feeding the raw bytes to digest"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rb') as f:
+        for raw in f:
+            digest.update(raw)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha1()
+    for _ in _hashed_lines(path, digest):
+        pass
+    return digest.hexdigest()
+
+
+def _parse_job(path: str):
+    """Parse one dump in a worker, returning (sha1, rows as plain tuples)"""
+    digest = hashlib.sha1()
+    rows = [tuple(iface) for iface in iter_interfaces(_hashed_lines(path, digest))]
+    return digest.hexdigest(), rows
+
+
+def parser_stamp() -> str:
+    """Fingerprint of the parsing code so cached rows are dropped when it changes"""
+    digest = hashlib.sha1(f"{CACHE_VERSION}|{Interface._fields}|{sorted(HEADER_FIELDS.items())}".encode())
+
+    def add_code(code):
+        digest.update(code.co_code)
+        for const in code.co_consts:
+            if hasattr(const, 'co_code'):
+                add_code(const)
+            else:
+                digest.update(repr(const).encode())
+
+    for func in (iter_interfaces, header_columns, slice_row, split_row):
+        add_code(func.__code__)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """On-disk cache of parsed dumps keyed by path, size, mtime and content hash"""
+
+    FILENAME = "parse-cache.json"
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, self.FILENAME)
+        self.stamp = parser_stamp()
+        self.entries = {}
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get("stamp") == self.stamp:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, path: str):
+        """Return (rows or None on a miss, file signature to pass to store())"""
+        key = os.path.abspath(path)
+        self.seen.add(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.misses += 1
+            return None, None
+        signature = (st.st_size, st.st_mtime_ns)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            if (entry["size"], entry["mtime_ns"]) == signature:
+                self.hits += 1
+                return entry["rows"], signature
+            # Touched but possibly unchanged (e.g. re-copied), compare content
+            try:
+                digest = file_digest(path)
+            except OSError:
+                digest = None
+            if digest == entry["sha1"]:
+                entry["size"], entry["mtime_ns"] = signature
+                self.hits += 1
+                return entry["rows"], signature
+
+        self.misses += 1
+        return None, signature
+
+    def store(self, path: str, signature, digest: str, rows):
+        if signature is None:
+            return
+        self.entries[os.path.abspath(path)] = {
+            "size": signature[0],
+            "mtime_ns": signature[1],
+            "sha1": digest,
+            "rows": rows,
+        }
+
+    def save(self, progress=None):
+        """Write the cache, dropping entries of files that were not looked up in this run
+
+        progress, e.g. print, gets a line when the cache cannot be written.
+        """
+        progress = progress or _silent
+        entries = {key: entry for key, entry in self.entries.items() if key in self.seen}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"stamp": self.stamp, "entries": entries}, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            progress(f"⚠️  Could not write parse cache {self.path}: {e}")
+
+
+def batch_files(spec: str):
+    """List the dumps selected by --batch: a directory's *.txt/*.txt.gz files or a glob"""
+    if os.path.isdir(spec):
+        patterns = [os.path.join(spec, "*.txt"), os.path.join(spec, "*.txt.gz")]
+    else:
+        patterns = [spec]
+    return sorted(set(path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path)))
+
+
+def ingest(paths, jobs: int = 1, cache: ParseCache = None, progress=None):
+    """Parse switch dumps, in a process pool when jobs > 1 and from the cache when possible
+
+    progress, e.g. print, gets a line for each dump that replaces an earlier one.
+
+    Returns {switch name: [Interface]} in the order of paths, and the number of files parsed.
+    """
+    progress = progress or _silent
+    results = {}
+    pending = []
+    for path in paths:
+        rows, signature = cache.lookup(path) if cache is not None else (None, None)
+        if rows is None:
+            pending.append((path, signature))
+        else:
+            results[path] = rows
+
+    if jobs > 1 and len(pending) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            parsed = list(executor.map(_parse_job, [path for path, _ in pending],
+                                       chunksize=max(1, len(pending) // (jobs * 4))))
+    else:
+        parsed = [_parse_job(path) for path, _ in pending]
+    for (path, signature), (digest, rows) in zip(pending, parsed):
+        results[path] = rows
+        if cache is not None:
+            cache.store(path, signature, digest, rows)
+
+    switch_data = {}
+    for path in paths:
+        sw = switch_name(path)
+        if sw in switch_data:
+            progress(f"⚠️  {path} replaces an earlier dump of switch {sw}")
+        switch_data[sw] = [Interface._make(row) for row in results[path]]
+    return switch_data, len(pending)
+
+
+DEFAULT_COLLECT_COMMAND = "show interface status"
+RETRY_DELAY = 1.0
+
+
+class CollectError(Exception):
+    pass
+
+
+def read_inventory(path: str):
+    """Read a switch inventory: one 'name [ssh target]' per line, '#' starts a comment
+
+    Returns:
+        [(switch name, ssh target)], the target defaulting to the name
+    """
+    inventory = []
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split("#", 1)[0].split()
+            if fields:
+                inventory.append((fields[0], fields[1] if len(fields) > 1 else fields[0]))
+    return inventory
+
+
+def ssh_control_dir() -> str:
+    """Per-user directory for the multiplexed SSH master sockets, shared across runs
+
+    It lives in $XDG_RUNTIME_DIR, or in ~/.ssh when that is not set, never in
+    the shared temp directory. Whoever controls the sockets controls the switch
+    sessions, so a directory that is a symlink, belongs to another user or is
+    open to group or others is refused.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        base = runtime_dir
+    else:
+        base = os.path.join(os.path.expanduser("~"), ".ssh")
+        os.makedirs(base, mode=0o700, exist_ok=True)
+    path = os.path.join(base, "topo-ssh")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise CollectError(f"unsafe SSH control directory {path}: it must be a directory "
+                           f"owned by you with mode 0700")
+    return path
+
+
+async def _fetch_switch(name: str, target: str, ssh, command: str, timeout: float, retries: int, semaphore,
+                        control_dir: str):
+    import asyncio
+    # ControlMaster keeps one connection per switch open for retries and later runs
+    argv = list(ssh) + ["-o", "BatchMode=yes", "-o", f"ConnectTimeout={max(1, int(timeout))}",
+                        "-o", "ControlMaster=auto", "-o", f"ControlPath={control_dir}/%C",
+                        "-o", "ControlPersist=60", target, command]
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(RETRY_DELAY * attempt)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                proc = await asyncio.create_subprocess_exec(*argv, stdin=asyncio.subprocess.DEVNULL,
+                                                            stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.PIPE)
+            except OSError as e:
+                raise CollectError(f"cannot run {argv[0]}: {e.strerror}")
+            try:
+                output, errors = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                error = f"timed out after {timeout:g}s"
+                continue
+            if proc.returncode == 0:
+                return output, attempt + 1, time.perf_counter() - start
+            lines = errors.decode('utf-8', errors='replace').strip().splitlines()
+            error = lines[-1] if lines else f"exit status {proc.returncode}"
+    raise CollectError(f"{error} ({retries + 1} attempt{'s' if retries else ''})")
+
+
+async def _collect(inventory, ssh, command: str, jobs: int, timeout: float, retries: int, control_dir: str,
+                   save_dir: str = None, progress=_silent):
+    import asyncio
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def fetch(name, target):
+        try:
+            return name, await _fetch_switch(name, target, ssh, command, timeout, retries, semaphore,
+                                                  control_dir), None
+        except CollectError as e:
+            return name, None, e
+
+    results = {}
+    failed = {}
+    tasks = [asyncio.ensure_future(fetch(name, target)) for name, target in inventory]
+    # Parse each switch as soon as it answers instead of waiting for the slowest one
+    for future in asyncio.as_completed(tasks):
+        name, fetched, error = await future
+        if error is not None:
+            failed[name] = str(error)
+            progress(f"❗ {name}: {error}")
+            continue
+        output, attempts, elapsed = fetched
+        text = output.decode('utf-8', errors='replace')
+        results[name] = list(iter_interfaces(io.StringIO(text)))
+        if save_dir:
+            with open(os.path.join(save_dir, f"{name}.txt"), 'w') as f:
+                f.write(text)
+        retried = f", {attempts} attempts" if attempts > 1 else ""
+        count = len(results[name])
+        progress(f"📡 {name}: {count} interface{'s' if count != 1 else ''} ({elapsed:.1f}s{retried})")
+    return results, failed
+
+
+def collect(inventory, ssh="ssh", command: str = DEFAULT_COLLECT_COMMAND, jobs: int = 32,
+            timeout: float = 30.0, retries: int = 2, save_dir: str = None, progress=None):
+    """Fetch and parse the interface tables of many switches concurrently over SSH
+
+    progress, e.g. print, gets a line for each switch as it answers or fails.
+
+    Returns:
+        ({switch name: [Interface]} in inventory order, {switch name: error} for the failed ones)
+
+    Raises:
+        CollectError: The SSH control directory is not private to this user
+    """
+    import asyncio
+    if isinstance(ssh, str):
+        ssh = shlex.split(ssh)
+    control_dir = ssh_control_dir()
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    results, failed = asyncio.run(_collect(inventory, ssh, command, max(1, jobs), timeout, retries, control_dir,
+                                           save_dir, progress or _silent))
+    return {name: results[name] for name, _ in inventory if name in results}, failed
+
+
+def escape_label(text: str) -> str:
+    text = text.replace("\\", "\\\\")
+    text = text.replace('"', '\"')
+    return text
+
+def node_id(device: str, port: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{device}_{port}")  # Safe ID for Graphviz
+
+
+class Link:
+    """One cable between two (device, port) endpoints, however many sides reported it"""
+
+    __slots__ = ("a", "b", "reported_by")
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.reported_by = set()
+
+
+class Topology:
+    """Fabric model: every port keyed by (device, port), each reported link merged into one edge"""
+
+    def __init__(self):
+        self.switches = {}    # switch -> [port names] in dump order
+        self.ports = {}       # (switch, port) -> Interface
+        self.links = {}       # sorted (endpoint, endpoint) -> Link
+        self.port_links = {}  # endpoint -> Link it was last reported in
+
+    @classmethod
+    def from_switch_data(cls, switch_data: dict):
+        topology = cls()
+        for sw, iface_list in switch_data.items():
+            topology.add_switch(sw, iface_list)
+        return topology
+
+    def add_switch(self, sw: str, iface_list):
+        names = self.switches.setdefault(sw, [])
+        for iface in iface_list:
+            local = (sw, iface.interface)
+            if local not in self.ports:
+                names.append(iface.interface)
+            self.ports[local] = iface
+            if not iface.remote_host:
+                continue
+            remote = (iface.remote_host, iface.remote_port)
+            key = (local, remote) if local <= remote else (remote, local)
+            link = self.links.get(key)
+            if link is None:
+                # Orient the edge from the first side that reported it
+                link = self.links[key] = Link(local, remote)
+            link.reported_by.add(local)
+            self.port_links[local] = link
+            self.port_links.setdefault(remote, link)
+
+    def external_endpoints(self):
+        """Link endpoints that are not a port of any parsed switch, in link order"""
+        seen = {}
+        for link in self.links.values():
+            for endpoint in (link.a, link.b):
+                if endpoint not in self.ports:
+                    seen.setdefault(endpoint, None)
+        return list(seen)
+
+    def link_issues(self, link: Link):
+        """Describe why a link is asymmetric or mismatched (empty when it is consistent)"""
+        issues = []
+        for local, remote in ((link.a, link.b), (link.b, link.a)):
+            if local in link.reported_by or local[0] not in self.switches:
+                continue
+            peer = self.ports.get(local)
+            if peer is None:
+                issues.append(f"asymmetric: {local[0]} has no port {local[1]}")
+            elif peer.remote_host:
+                issues.append(f"asymmetric: {local[0]}:{local[1]} reports "
+                              f"{peer.remote_host}:{peer.remote_port} instead of {remote[0]}:{remote[1]}")
+            else:
+                issues.append(f"asymmetric: {local[0]}:{local[1]} reports no neighbor")
+
+        a, b = self.ports.get(link.a), self.ports.get(link.b)
+        if a is not None and b is not None:
+            for field in ("speed", "mtu", "oper"):
+                a_value, b_value = getattr(a, field), getattr(b, field)
+                if a_value and b_value and a_value.lower() != b_value.lower():
+                    issues.append(f"{field} mismatch: {a_value} / {b_value}")
+        return issues
+
+    def port_rows(self):
+        """Yield (switch, Interface, link or None) for every parsed port"""
+        for sw, names in self.switches.items():
+            for name in names:
+                local = (sw, name)
+                yield sw, self.ports[local], self.port_links.get(local)
+
+    def summary(self) -> str:
+        flagged = [self.link_issues(link) for link in self.links.values()]
+        asymmetric = sum(1 for issues in flagged if any(i.startswith("asymmetric") for i in issues))
+        mismatched = sum(1 for issues in flagged if any("mismatch" in i for i in issues))
+        both = sum(1 for link in self.links.values() if len(link.reported_by) == 2)
+        return (f"{len(self.ports)} ports, {len(self.links)} links ({both} reported by both sides), "
+                f"{asymmetric} asymmetric, {mismatched} mismatched")
+
+
+def _new_digraph(dark: bool):
+    dot = _graphviz().Digraph(comment="Network Topology", format='svg')
+    if dark:
+        dot.attr(bgcolor="#1e1e1e")
+        dot.attr('node', fontcolor='white', color='#888888',
+                 style='filled', fillcolor='#2e2e2e')
+        dot.attr('edge', color='white', fontcolor='white')
+    else:
+        dot.attr('node', style='filled', fillcolor='#2a2a2a')
+    return dot
+
+
+def build_dot(topology: Topology, dark: bool, grouped: bool, switches=None, peer_url=None):
+    """Build the DOT graph of the whole fabric, or only of some of its switches
+
+    With switches, only their ports and the links touching them are drawn, and
+    ports of other switches become dashed boxes; peer_url(device) may return a
+    link target for those boxes.
+    """
+    dot = _new_digraph(dark)
+    drawn = topology.switches if switches is None else {sw: topology.switches[sw] for sw in switches}
+
+    for sw, names in drawn.items():
+        site = extract_site(sw)
+        cluster_id = re.sub(r"[^a-zA-Z0-9_]", "_", f"cluster_{site}")  # Safe ID for Graphviz"
+        with dot.subgraph(name=cluster_id) as sub:
+            if grouped:
+                sub.attr(label=site)
+            for name in names:
+                iface = topology.ports[(sw, name)]
+                speed = iface.speed
+                mtu = iface.mtu
+                label_parts = [f"{sw}", f"[{iface.interface}]", f"Speed: {speed}" if speed else "", f"MTU: {mtu}" if mtu else ""]
+                local_label = escape_label("\n".join(part for part in label_parts if part))
+                color = "green" if iface.oper.lower() == "up" else "red"
+                sub.node(node_id(sw, name), label=local_label, color=color, fontcolor=color)
+
+    if switches is None:
+        links = list(topology.links.values())
+        outside = topology.external_endpoints()
+    else:
+        links = [link for link in topology.links.values() if link.a[0] in drawn or link.b[0] in drawn]
+        outside = list(dict.fromkeys(endpoint for link in links for endpoint in (link.a, link.b)
+                                     if endpoint[0] not in drawn))
+    for host, port in outside:
+        remote_label = escape_label(f"{host}\n[{port}]")
+        url = peer_url(host) if peer_url is not None else None
+        attrs = {'URL': url} if url else {}
+        dot.node(node_id(host, port), label=remote_label, shape='box', style='dashed', **attrs)
+
+    for link in links:
+        attrs = {'dir': 'none'}
+        issues = topology.link_issues(link)
+        if issues:
+            attrs.update(color='orange', tooltip=escape_label("; ".join(issues)))
+            if any(issue.startswith("asymmetric") for issue in issues):
+                attrs['style'] = 'dashed'
+        dot.edge(node_id(*link.a), node_id(*link.b), **attrs)
+    return dot
+
+
+LINK_TABLE_HEADER = ["Switch", "Interface", "Speed", "Remote Host", "Remote Port", "MTU", "Oper", "Link Issues"]
+
+
+def link_table(topology: Topology):
+    """Yield the per-port link table rows written to the CSV and the snapshot store"""
+    for sw, iface, link in topology.port_rows():
+        issues = "; ".join(topology.link_issues(link)) if link is not None else ""
+        yield [sw, iface.interface, iface.speed, iface.remote_host, iface.remote_port,
+               iface.mtu, iface.oper, issues]
+
+
+def write_csv(topology: Topology, csv_path: str):
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(LINK_TABLE_HEADER)
+        writer.writerows(link_table(topology))
+
+
+def render_formats(dot, formats, paths=None):
+    """Lay dot out once and render it natively in every format
+
+    A single dot run with a -T<fmt> -o <file> pair per format computes the
+    layout once and hands it to each renderer, so extra formats cost only
+    their rendering. A single format is piped straight back.
+
+    Args:
+        paths: {format: file} for formats to write straight to disk
+    Returns:
+        {format: bytes} for the formats not in paths
+    """
+    paths = paths or {}
+    if len(formats) == 1 and not paths:
+        return {formats[0]: _graphviz().pipe('dot', formats[0], dot.source.encode())}
+    import subprocess
+    import tempfile
+    with tempfile.TemporaryDirectory(prefix='topo-render-') as tmp:
+        kept = {fmt: os.path.join(tmp, f"graph.{fmt}") for fmt in formats if fmt not in paths}
+        argv = ['dot']
+        for fmt in formats:
+            argv += [f'-T{fmt}', '-o', paths.get(fmt) or kept[fmt]]
+        subprocess.run(argv, input=dot.source.encode(), stdout=subprocess.DEVNULL, check=True)
+        rendered = {}
+        for fmt, path in kept.items():
+            with open(path, 'rb') as f:
+                rendered[fmt] = f.read()
+        return rendered
+
+
+def write_rendered(dot, base: str, formats):
+    """Write the DOT source to base and the rendered formats next to it
+
+    Returns:
+        ({format: path}, SVG bytes)
+    """
+    with open(base, 'w') as f:
+        f.write(dot.source)
+    paths = {fmt: base + ("." if fmt == 'svg' else f"_{fmt}.") + fmt for fmt in formats}
+    # The SVG also goes into the HTML page, so it comes back in memory
+    svg = render_formats(dot, formats, {fmt: path for fmt, path in paths.items() if fmt != 'svg'})['svg']
+    with open(paths['svg'], 'wb') as f:
+        f.write(svg)
+    return paths, svg
+
+
+def flagged_links(topology: Topology, links=None):
+    """Return [(link, issues)] for the links (default: all) with issues"""
+    flagged = []
+    for link in topology.links.values() if links is None else links:
+        issues = topology.link_issues(link)
+        if issues:
+            flagged.append((link, issues))
+    return flagged
+
+
+def write_html(html_path: str, svg: bytes, dark: bool, title: str = "Network Topology",
+               flagged=(), nav=()):
+    """Write an HTML page embedding an SVG, with optional [(href, text)] links and link issues"""
+    with open(html_path, 'w') as html:
+        html.write(f"<html><head><title>{html_escape(title)}</title>")
+        if dark:
+            html.write("<style>body{background:#1e1e1e;color:white;}a{color:#8ab4f8;}</style>")
+        html.write("</head><body>")
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        html.write(f"<h2>{html_escape(title)} — {timestamp}</h2>")
+        if nav:
+            html.write("<ul>")
+            for href, text in nav:
+                html.write(f'<li><a href="{html_escape(href)}">{html_escape(text)}</a></li>')
+            html.write("</ul>")
+        html.write(svg.decode('utf-8'))
+        if flagged:
+            html.write(f"<h3>Link issues ({len(flagged)})</h3><ul>")
+            for link, issues in flagged:
+                ends = " — ".join(f"{device}:{port}" for device, port in (link.a, link.b))
+                html.write(f"<li>{html_escape(ends)}: {html_escape('; '.join(issues))}</li>")
+            html.write("</ul>")
+        html.write("</body></html>")
+
+
+def open_in_browser(html_path: str):
+    import webbrowser
+    try:
+        webbrowser.open(f"file://{os.path.abspath(html_path)}")
+    except Exception:
+        pass
+
+
+def build_outputs(topology: Topology, base: str, dark: bool, grouped: bool,
+                  save_pdf: bool, save_png: bool, save_csv: bool, progress=None):
+    """Write the diagram, HTML page and optional PNG/PDF/CSV for base and return the HTML path
+
+    progress, e.g. print, gets a line for each file written.
+    """
+    progress = progress or _silent
+    progress(f"🔗 {topology.summary()}")
+    dot = build_dot(topology, dark, grouped)
+
+    formats = ['svg'] + (['png'] if save_png else []) + (['pdf'] if save_pdf else [])
+    start = time.perf_counter()
+    paths, svg = write_rendered(dot, base, formats)
+    progress(f"⏱️  Laid out once and rendered {', '.join(formats)} in {time.perf_counter() - start:.2f}s")
+    progress(f"✅ SVG saved: {paths['svg']}")
+    if save_png:
+        progress(f"🖼️ PNG saved: {paths['png']}")
+    if save_pdf:
+        progress(f"📄 PDF saved: {paths['pdf']}")
+
+    html_path = base + ".html"
+    write_html(html_path, svg, dark, flagged=flagged_links(topology))
+    progress(f"✅ HTML saved: {html_path}")
+
+    if save_csv:
+        csv_path = base + ".csv"
+        write_csv(topology, csv_path)
+        progress(f"✅ CSV saved: {csv_path}")
+
+    return html_path
+
+
+VIEWER_THEMES = {
+    False: {"bg": "#ffffff", "fg": "#222222", "bar": "#eeeeee", "fill": "#2a2a2a", "up": "#00a000",
+            "down": "#e00000", "link": "#555555", "issue": "orange", "mark": "#1e90ff"},
+    True: {"bg": "#1e1e1e", "fg": "#ffffff", "bar": "#2b2b2b", "fill": "#2e2e2e", "up": "#00c000",
+           "down": "#ff4040", "link": "#bbbbbb", "issue": "orange", "mark": "#1e90ff"},
+}
+
+# Offline viewer page: the topology arrives in per-site <script> chunks calling
+# TOPO.addSite(), and only the nodes and links inside the viewport are drawn.
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>__TITLE__</title>
+<style>
+html,body{margin:0;height:100%;overflow:hidden;font:13px sans-serif;background:__BG__;color:__FG__}
+#bar{position:absolute;top:0;left:0;right:0;height:36px;display:flex;gap:8px;align-items:center;padding:0 8px;background:__BAR__}
+#bar input{width:240px}
+#status{margin-left:auto;opacity:.8;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}
+#results{position:absolute;top:36px;left:8px;max-height:50%;overflow:auto;background:__BAR__;z-index:1}
+#results div{padding:2px 8px;cursor:pointer}
+#results div:hover{background:#888}
+canvas{position:absolute;top:36px;left:0;cursor:grab}
+</style></head><body>
+<div id="bar"><b>__TITLE__</b><input id="search" placeholder="Search host or port">
+<select id="site"><option value="">All sites</option></select><button id="fit">Fit</button>
+<span id="status">Loading...</span></div>
+<div id="results"></div>
+<canvas id="view"></canvas>
+<script>
+"use strict";
+var TOPO = (function () {
+  var CELL = 256, MARGIN = 128, LONG_CELLS = 16;
+  var theme = __THEME__;
+  var nodes = [], links = [], sites = [], grid = new Map(), longLinks = [];
+  var bounds = [Infinity, Infinity, -Infinity, -Infinity];
+  var canvas = document.getElementById("view"), ctx = canvas.getContext("2d");
+  var status = document.getElementById("status"), results = document.getElementById("results");
+  var siteSelect = document.getElementById("site"), search = document.getElementById("search");
+  var scale = 1, ox = 0, oy = 0, width = 0, height = 0, dpr = 1;
+  var fitted = false, queued = false, selected = null, info = "";
+
+  function bucket(cx, cy) {
+    var key = cx + "," + cy, cell = grid.get(key);
+    if (!cell) { cell = {nodes: [], links: []}; grid.set(key, cell); }
+    return cell;
+  }
+
+  function grow(box, x0, y0, x1, y1) {
+    box[0] = Math.min(box[0], x0); box[1] = Math.min(box[1], y0);
+    box[2] = Math.max(box[2], x1); box[3] = Math.max(box[3], y1);
+  }
+
+  function addSite(chunk) {
+    var box = [Infinity, Infinity, -Infinity, -Infinity];
+    chunk.nodes.forEach(function (n) {
+      var node = {device: n[0], port: n[1], speed: n[2], mtu: n[3], state: n[4],
+                  x: n[5], y: n[6], w: n[7], h: n[8], site: sites.length, links: []};
+      nodes.push(node);
+      bucket(Math.floor(node.x / CELL), Math.floor(node.y / CELL)).nodes.push(node);
+      grow(box, node.x - node.w / 2, node.y - node.h / 2, node.x + node.w / 2, node.y + node.h / 2);
+    });
+    chunk.links.forEach(function (l) {
+      var link = {a: nodes[l[0]], b: nodes[l[1]], issues: l[2]};
+      links.push(link);
+      link.a.links.push(link); link.b.links.push(link);
+      var cx0 = Math.floor(Math.min(link.a.x, link.b.x) / CELL), cx1 = Math.floor(Math.max(link.a.x, link.b.x) / CELL);
+      var cy0 = Math.floor(Math.min(link.a.y, link.b.y) / CELL), cy1 = Math.floor(Math.max(link.a.y, link.b.y) / CELL);
+      if ((cx1 - cx0 + 1) * (cy1 - cy0 + 1) > LONG_CELLS) { longLinks.push(link); return; }
+      for (var cx = cx0; cx <= cx1; cx++) for (var cy = cy0; cy <= cy1; cy++) bucket(cx, cy).links.push(link);
+    });
+    sites.push({name: chunk.site, box: box});
+    var option = document.createElement("option");
+    option.value = sites.length - 1; option.textContent = chunk.site + " (" + chunk.nodes.length + ")";
+    siteSelect.appendChild(option);
+    if (box[0] <= box[2]) grow(bounds, box[0], box[1], box[2], box[3]);
+    if (!fitted && nodes.length) { fit(bounds); fitted = true; }
+    redraw();
+  }
+
+  function fit(box) {
+    if (!(box[0] <= box[2])) return;
+    var w = Math.max(box[2] - box[0], 1), h = Math.max(box[3] - box[1], 1);
+    scale = Math.min(width / w, height / h) * 0.95;
+    ox = (width - w * scale) / 2 - box[0] * scale;
+    oy = (height - h * scale) / 2 - box[1] * scale;
+    redraw();
+  }
+
+  function redraw() {
+    if (!queued) { queued = true; requestAnimationFrame(draw); }
+  }
+
+  function visible() {
+    var x0 = -ox / scale - MARGIN, y0 = -oy / scale - MARGIN;
+    var x1 = (width - ox) / scale + MARGIN, y1 = (height - oy) / scale + MARGIN;
+    var cx0 = Math.floor(x0 / CELL), cx1 = Math.floor(x1 / CELL), cy0 = Math.floor(y0 / CELL), cy1 = Math.floor(y1 / CELL);
+    var seen = new Set(), shownNodes = [], shownLinks = [];
+    function take(cell) {
+      cell.nodes.forEach(function (n) { shownNodes.push(n); });
+      cell.links.forEach(function (l) { if (!seen.has(l)) { seen.add(l); shownLinks.push(l); } });
+    }
+    if ((cx1 - cx0 + 1) * (cy1 - cy0 + 1) > grid.size) {
+      grid.forEach(function (cell, key) {
+        var xy = key.split(","), cx = +xy[0], cy = +xy[1];
+        if (cx >= cx0 && cx <= cx1 && cy >= cy0 && cy <= cy1) take(cell);
+      });
+    } else {
+      for (var cx = cx0; cx <= cx1; cx++) for (var cy = cy0; cy <= cy1; cy++) {
+        var cell = grid.get(cx + "," + cy);
+        if (cell) take(cell);
+      }
+    }
+    longLinks.forEach(function (l) {
+      if (Math.max(l.a.x, l.b.x) >= x0 && Math.min(l.a.x, l.b.x) <= x1 &&
+          Math.max(l.a.y, l.b.y) >= y0 && Math.min(l.a.y, l.b.y) <= y1) shownLinks.push(l);
+    });
+    return {nodes: shownNodes, links: shownLinks};
+  }
+
+  function strokeLinks(list, color, dashed) {
+    if (!list.length) return;
+    ctx.beginPath();
+    list.forEach(function (l) { ctx.moveTo(l.a.x, l.a.y); ctx.lineTo(l.b.x, l.b.y); });
+    ctx.strokeStyle = color; ctx.setLineDash(dashed ? [6, 4] : []); ctx.stroke();
+  }
+
+  function draw() {
+    queued = false;
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.fillStyle = theme.bg; ctx.fillRect(0, 0, width, height);
+    ctx.setTransform(dpr * scale, 0, 0, dpr * scale, dpr * ox, dpr * oy);
+    ctx.lineWidth = 1 / scale;
+    var shown = visible();
+    var plain = [], issues = [], asymmetric = [];
+    shown.links.forEach(function (l) {
+      (!l.issues ? plain : l.issues.indexOf("asymmetric") >= 0 ? asymmetric : issues).push(l);
+    });
+    strokeLinks(plain, theme.link, false);
+    strokeLinks(issues, theme.issue, false);
+    strokeLinks(asymmetric, theme.issue, true);
+    ctx.setLineDash([]);
+
+    var labels = scale * 14 > 8, details = scale * 14 > 16;
+    ctx.font = "14px sans-serif"; ctx.textAlign = "center"; ctx.textBaseline = "middle";
+    shown.nodes.forEach(function (n) {
+      var x = n.x - n.w / 2, y = n.y - n.h / 2;
+      var color = n.state < 0 ? theme.fg : n.state ? theme.up : theme.down;
+      if (n.state >= 0) { ctx.fillStyle = theme.fill; ctx.fillRect(x, y, n.w, n.h); }
+      ctx.strokeStyle = color; ctx.setLineDash(n.state < 0 ? [4, 3] : []); ctx.strokeRect(x, y, n.w, n.h);
+      if (!labels) return;
+      var lines = [n.device, "[" + n.port + "]"];
+      if (details) {
+        if (n.speed) lines.push("Speed: " + n.speed);
+        if (n.mtu) lines.push("MTU: " + n.mtu);
+      }
+      ctx.fillStyle = color;
+      lines.forEach(function (text, i) { ctx.fillText(text, n.x, n.y + (i - (lines.length - 1) / 2) * 16); });
+    });
+    ctx.setLineDash([]);
+    if (selected) {
+      ctx.strokeStyle = theme.mark; ctx.lineWidth = 3 / scale;
+      ctx.strokeRect(selected.x - selected.w / 2 - 4, selected.y - selected.h / 2 - 4, selected.w + 8, selected.h + 8);
+    }
+    status.textContent = (info ? info + " | " : "") + shown.nodes.length + " of " + nodes.length + " ports drawn, " +
+      sites.length + " sites loaded";
+  }
+
+  function resize() {
+    dpr = window.devicePixelRatio || 1;
+    width = window.innerWidth; height = window.innerHeight - 36;
+    canvas.width = width * dpr; canvas.height = height * dpr;
+    canvas.style.width = width + "px"; canvas.style.height = height + "px";
+    redraw();
+  }
+
+  function nodeAt(mx, my) {
+    var x = (mx - ox) / scale, y = (my - oy) / scale, cx = Math.floor(x / CELL), cy = Math.floor(y / CELL);
+    for (var dx = -1; dx <= 1; dx++) for (var dy = -1; dy <= 1; dy++) {
+      var cell = grid.get((cx + dx) + "," + (cy + dy));
+      if (!cell) continue;
+      for (var i = 0; i < cell.nodes.length; i++) {
+        var n = cell.nodes[i];
+        if (Math.abs(x - n.x) <= n.w / 2 && Math.abs(y - n.y) <= n.h / 2) return n;
+      }
+    }
+    return null;
+  }
+
+  function select(n, center) {
+    selected = n;
+    if (!n) { info = ""; redraw(); return; }
+    var peers = n.links.map(function (l) {
+      var peer = l.a === n ? l.b : l.a;
+      return peer.device + ":" + peer.port + (l.issues ? " (" + l.issues + ")" : "");
+    });
+    info = n.device + ":" + n.port + (n.speed ? " " + n.speed : "") + (n.mtu ? " MTU " + n.mtu : "") +
+      (peers.length ? " -> " + peers.join(", ") : "");
+    if (center) {
+      scale = Math.max(scale, 1.5);
+      ox = width / 2 - n.x * scale; oy = height / 2 - n.y * scale;
+    }
+    redraw();
+  }
+
+  var drag = null;
+  canvas.addEventListener("mousedown", function (e) { drag = {x: e.offsetX, y: e.offsetY, moved: false}; });
+  window.addEventListener("mouseup", function (e) {
+    if (drag && !drag.moved && e.target === canvas) select(nodeAt(e.offsetX, e.offsetY), false);
+    drag = null;
+  });
+  canvas.addEventListener("mousemove", function (e) {
+    if (!drag) return;
+    var dx = e.offsetX - drag.x, dy = e.offsetY - drag.y;
+    if (Math.abs(dx) + Math.abs(dy) > 2) drag.moved = true;
+    ox += dx; oy += dy; drag.x = e.offsetX; drag.y = e.offsetY;
+    redraw();
+  });
+  canvas.addEventListener("wheel", function (e) {
+    e.preventDefault();
+    var factor = Math.exp(-e.deltaY * 0.0015);
+    ox = e.offsetX - (e.offsetX - ox) * factor; oy = e.offsetY - (e.offsetY - oy) * factor;
+    scale *= factor;
+    redraw();
+  }, {passive: false});
+  window.addEventListener("resize", resize);
+  document.getElementById("fit").addEventListener("click", function () {
+    var site = sites[siteSelect.value];
+    fit(site ? site.box : bounds);
+  });
+  siteSelect.addEventListener("change", function () {
+    var site = sites[siteSelect.value];
+    fit(site ? site.box : bounds);
+  });
+
+  var timer = null;
+  search.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var query = search.value.trim().toLowerCase();
+      results.textContent = "";
+      if (!query) return;
+      var found = 0;
+      for (var i = 0; i < nodes.length && found < 50; i++) {
+        var n = nodes[i];
+        if (n.device.toLowerCase().indexOf(query) < 0 && n.port.toLowerCase().indexOf(query) < 0 &&
+            (n.device + ":" + n.port).toLowerCase().indexOf(query) < 0) continue;
+        var row = document.createElement("div");
+        row.textContent = n.device + ":" + n.port;
+        row.addEventListener("click", select.bind(null, n, true));
+        results.appendChild(row);
+        found++;
+      }
+      if (!found) results.textContent = "No match";
+    }, 150);
+  });
+  search.addEventListener("keydown", function (e) {
+    if (e.key === "Enter" && results.firstChild && results.firstChild.click) results.firstChild.click();
+    if (e.key === "Escape") { search.value = ""; results.textContent = ""; }
+  });
+
+  resize();
+  return {addSite: addSite};
+})();
+</script>
+"""
+
+
+def layout_json(dot, paths=None):
+    """Lay dot out once, returning the positioned graph as parsed -Tjson and writing {format: file} paths"""
+    paths = paths or {}
+    rendered = render_formats(dot, ['json'] + list(paths), paths)
+    return json.loads(rendered['json'])
+
+
+def viewer_chunks(topology: Topology, layout: dict):
+    """Split the laid out topology into per-site chunks for the viewer
+
+    Nodes are [device, port, speed, mtu, state, x, y, width, height] with state
+    1 up, 0 down and -1 for endpoints outside the parsed switches. Links are
+    [node index, node index, issues] and ship in the chunk that completes them.
+    """
+    bb = [float(v) for v in layout.get("bb", "0,0,0,0").split(",")]
+    positions = {obj["name"]: obj for obj in layout.get("objects", []) if "pos" in obj}
+
+    def place(device, port):
+        obj = positions.get(node_id(device, port))
+        if obj is None:
+            return [0, 0, 108, 54]
+        x, y = (float(v) for v in obj["pos"].split(",")[:2])
+        # Graphviz puts the origin bottom-left, the canvas top-left
+        return [round(x, 1), round(bb[3] - y, 1), round(float(obj["width"]) * 72, 1),
+                round(float(obj["height"]) * 72, 1)]
+
+    by_site = {}
+    for sw, iface, _ in topology.port_rows():
+        state = 1 if iface.oper.lower() == "up" else 0
+        by_site.setdefault(extract_site(sw), []).append(
+            [sw, iface.interface, iface.speed, iface.mtu, state] + place(sw, iface.interface))
+    for host, port in topology.external_endpoints():
+        by_site.setdefault(extract_site(host), []).append([host, port, "", "", -1] + place(host, port))
+
+    index = {}
+    chunks = []
+    starts = []
+    for site, site_nodes in by_site.items():
+        starts.append(len(index))
+        for node in site_nodes:
+            index[(node[0], node[1])] = len(index)
+        chunks.append({"site": site, "nodes": site_nodes, "links": []})
+    for link in topology.links.values():
+        a, b = index[link.a], index[link.b]
+        # Ship the link with whichever of its endpoints' sites comes last
+        chunk = chunks[bisect_right(starts, max(a, b)) - 1]
+        chunk["links"].append([a, b, "; ".join(topology.link_issues(link))])
+    return chunks
+
+
+def write_viewer(html_path: str, chunks, dark: bool, title: str = "Network Topology"):
+    theme = VIEWER_THEMES[bool(dark)]
+    page = (VIEWER_HTML.replace("__TITLE__", html_escape(title))
+            .replace("__BG__", theme["bg"]).replace("__FG__", theme["fg"]).replace("__BAR__", theme["bar"])
+            .replace("__THEME__", json.dumps(theme)))
+    with open(html_path, 'w') as html:
+        html.write(page)
+        for chunk in chunks:
+            data = json.dumps(chunk, separators=(',', ':')).replace("</", "<\\/")
+            html.write(f"<script>TOPO.addSite({data});</script>\n")
+        html.write("</body></html>\n")
+
+
+def build_viewer_outputs(topology: Topology, base: str, dark: bool, grouped: bool,
+                         save_pdf: bool, save_png: bool, save_csv: bool, progress=None):
+    """Write the lazy-loading viewer page, from the same single layout pass as the PNG/PDF outputs
+
+    progress, e.g. print, gets a line for each file written.
+
+    Returns:
+        Path of the viewer page
+    """
+    progress = progress or _silent
+    progress(f"🔗 {topology.summary()}")
+    dot = build_dot(topology, dark, grouped)
+    with open(base, 'w') as f:
+        f.write(dot.source)
+
+    extra = (['png'] if save_png else []) + (['pdf'] if save_pdf else [])
+    paths = {fmt: f"{base}_{fmt}.{fmt}" for fmt in extra}
+    start = time.perf_counter()
+    layout = layout_json(dot, paths)
+    progress(f"⏱️  Laid out once{' and rendered ' + ', '.join(extra) if extra else ''} in "
+          f"{time.perf_counter() - start:.2f}s")
+    for fmt, path in paths.items():
+        progress(f"{'🖼️' if fmt == 'png' else '📄'} {fmt.upper()} saved: {path}")
+
+    html_path = base + ".html"
+    chunks = viewer_chunks(topology, layout)
+    write_viewer(html_path, chunks, dark)
+    progress(f"✅ HTML viewer saved: {html_path} ({len(chunks)} site chunks)")
+
+    if save_csv:
+        csv_path = base + ".csv"
+        write_csv(topology, csv_path)
+        progress(f"✅ CSV saved: {csv_path}")
+
+    return html_path
+
+
+def shard_sites(topology: Topology):
+    """Group the parsed switches by site/rack prefix: {site: [switches]}"""
+    sites = {}
+    for sw in topology.switches:
+        sites.setdefault(extract_site(sw), []).append(sw)
+    return sites
+
+
+def shard_file(site: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_.-]", "_", site)
+
+
+def build_site_graph(topology: Topology, dark: bool, sites: dict, shard_dir: str):
+    """Inter-site summary: a node per site, links between switches of two sites collapsed into one edge"""
+    dot = _new_digraph(dark)
+    for site, switches in sites.items():
+        ports = sum(len(topology.switches[sw]) for sw in switches)
+        dot.node(node_id("site", site), label=escape_label(f"{site}\n{len(switches)} switches, {ports} ports"),
+                 shape='box', URL=f"{shard_dir}/{shard_file(site)}.html")
+
+    aggregates = {}
+    for link in topology.links.values():
+        if link.a[0] not in topology.switches or link.b[0] not in topology.switches:
+            continue
+        pair = tuple(sorted((extract_site(link.a[0]), extract_site(link.b[0]))))
+        if pair[0] == pair[1]:
+            continue
+        counts = aggregates.setdefault(pair, [0, 0])
+        counts[0] += 1
+        counts[1] += bool(topology.link_issues(link))
+    for (site_a, site_b), (count, issues) in aggregates.items():
+        attrs = {'dir': 'none', 'label': f"{count} link{'s' if count != 1 else ''}", 'penwidth': str(min(1 + count / 4, 8))}
+        if issues:
+            attrs.update(color='orange', tooltip=f"{issues} with issues")
+        dot.edge(node_id("site", site_a), node_id("site", site_b), **attrs)
+    return dot
+
+
+def build_sharded_outputs(topology: Topology, base: str, dark: bool, grouped: bool,
+                          save_pdf: bool, save_png: bool, save_csv: bool, only_sites=None, jobs: int = 1,
+                          progress=None):
+    """Lay out and render one graph per site in parallel, plus an inter-site summary and an index page
+
+    With only_sites (which may be empty), only those shards are rebuilt; the
+    summary and index are always rewritten. progress, e.g. print, gets a line
+    for each file written.
+
+    Returns:
+        Path of the index page
+    """
+    progress = progress or _silent
+    progress(f"🔗 {topology.summary()}")
+    sites = shard_sites(topology)
+    selected = list(sites)
+    if only_sites is not None:
+        for site in only_sites:
+            if site not in sites:
+                progress(f"⚠️  No switches of site {site}, skipping it")
+        selected = [site for site in sites if site in only_sites]
+
+    shard_dir = os.path.basename(base) + "_shards"
+    shard_path = os.path.join(os.path.dirname(base), shard_dir)
+    os.makedirs(shard_path, exist_ok=True)
+    formats = ['svg'] + (['png'] if save_png else []) + (['pdf'] if save_pdf else [])
+    index_name = os.path.basename(base) + ".html"
+
+    def peer_url(device):
+        return f"{shard_file(extract_site(device))}.html" if device in topology.switches else None
+
+    def render_shard(site):
+        switches = sites[site]
+        shard_base = os.path.join(shard_path, shard_file(site))
+        dot = build_dot(topology, dark, grouped, switches=switches, peer_url=peer_url)
+        _, svg = write_rendered(dot, shard_base, formats)
+        links = [link for link in topology.links.values() if link.a[0] in switches or link.b[0] in switches]
+        write_html(shard_base + ".html", svg, dark, title=f"Network Topology — {site}",
+                   flagged=flagged_links(topology, links), nav=[(f"../{index_name}", "All sites")])
+
+    start = time.perf_counter()
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(selected) or 1))) as executor:
+        list(executor.map(render_shard, selected))
+    progress(f"⏱️  Rendered {len(selected)} of {len(sites)} site shards in {time.perf_counter() - start:.2f}s")
+    progress(f"✅ Shards saved: {shard_path}/")
+
+    summary = build_site_graph(topology, dark, sites, shard_dir)
+    paths, svg = write_rendered(summary, base, formats)
+    progress(f"✅ Site summary saved: {paths['svg']}")
+    nav = [(f"{shard_dir}/{shard_file(site)}.html",
+            f"{site}: {len(switches)} switches, {sum(len(topology.switches[sw]) for sw in switches)} ports")
+           for site, switches in sites.items()]
+    cross_site = [link for link in topology.links.values()
+                  if link.a[0] in topology.switches and link.b[0] in topology.switches
+                  and extract_site(link.a[0]) != extract_site(link.b[0])]
+    html_path = base + ".html"
+    write_html(html_path, svg, dark, title="Network Topology — Sites",
+               flagged=flagged_links(topology, cross_site), nav=nav)
+    progress(f"✅ HTML index saved: {html_path}")
+
+    if save_csv:
+        csv_path = base + ".csv"
+        write_csv(topology, csv_path)
+        progress(f"✅ CSV saved: {csv_path}")
+
+    return html_path
+
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    ports INTEGER NOT NULL,
+    links INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ports (
+    snapshot INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    switch TEXT NOT NULL,
+    interface TEXT NOT NULL,
+    speed TEXT NOT NULL,
+    remote_host TEXT NOT NULL,
+    remote_port TEXT NOT NULL,
+    mtu TEXT NOT NULL,
+    oper TEXT NOT NULL,
+    issues TEXT NOT NULL,
+    PRIMARY KEY (snapshot, switch, interface)
+) WITHOUT ROWID;
+"""
+
+# Change kinds of a snapshot diff: (key, report marker, description)
+CHANGE_KINDS = [
+    ("added", "+", "added"),
+    ("removed", "-", "removed"),
+    ("oper", "~", "oper changed"),
+    ("speed", "!", "newly speed-mismatched"),
+]
+
+# Rows of the new snapshot (n) are matched to the old one (o) through the primary key
+_DIFF_QUERIES = {
+    "added": """
+        SELECT n.switch, n.interface, n.remote_host, n.remote_port, '' FROM ports n
+        LEFT JOIN ports o ON o.snapshot = :old AND o.switch = n.switch AND o.interface = n.interface
+        WHERE n.snapshot = :new AND n.remote_host != ''
+          AND (o.switch IS NULL OR o.remote_host != n.remote_host OR o.remote_port != n.remote_port)""",
+    "oper": """
+        SELECT n.switch, n.interface, n.remote_host, n.remote_port, o.oper || ' -> ' || n.oper FROM ports n
+        JOIN ports o ON o.snapshot = :old AND o.switch = n.switch AND o.interface = n.interface
+        WHERE n.snapshot = :new AND lower(o.oper) != lower(n.oper)""",
+    "speed": """
+        SELECT n.switch, n.interface, n.remote_host, n.remote_port, n.issues FROM ports n
+        LEFT JOIN ports o ON o.snapshot = :old AND o.switch = n.switch AND o.interface = n.interface
+        WHERE n.snapshot = :new AND n.issues LIKE '%speed mismatch%'
+          AND (o.switch IS NULL OR o.issues NOT LIKE '%speed mismatch%')""",
+}
+
+
+class SnapshotStore:
+    """SQLite history of the per-port link table, one snapshot per run"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SNAPSHOT_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def latest(self):
+        """Return (id, taken, settings) of the newest snapshot, or None"""
+        return self.db.execute("SELECT id, taken, settings FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+
+    def snapshots(self):
+        return self.db.execute("SELECT id, taken, ports, links FROM snapshots ORDER BY id").fetchall()
+
+    def resolve(self, ref: int) -> int:
+        """Turn a snapshot id, or -1 for the latest, -2 for the one before, ... into an id"""
+        if ref >= 0:
+            row = self.db.execute("SELECT id FROM snapshots WHERE id = ?", (ref,)).fetchone()
+        else:
+            row = self.db.execute("SELECT id FROM snapshots ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                  (-ref - 1,)).fetchone()
+        if row is None:
+            raise ValueError(f"no snapshot {ref} in {self.path}")
+        return row[0]
+
+    def record(self, topology: Topology, settings: str) -> int:
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO snapshots (taken, settings, ports, links) VALUES (?, ?, ?, ?)",
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), settings, len(topology.ports), len(topology.links)))
+            snapshot = cursor.lastrowid
+            self.db.executemany("INSERT OR REPLACE INTO ports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                ([snapshot] + row for row in link_table(topology)))
+        return snapshot
+
+    def discard(self, snapshot: int):
+        """Drop a snapshot and its ports, e.g. one whose outputs failed to render"""
+        with self.db:
+            self.db.execute("DELETE FROM snapshots WHERE id = ?", (snapshot,))
+
+    def prune(self, keep: int) -> int:
+        """Drop all but the newest keep snapshots and return how many went"""
+        with self.db:
+            cursor = self.db.execute("DELETE FROM snapshots WHERE id NOT IN "
+                                     "(SELECT id FROM snapshots ORDER BY id DESC LIMIT ?)", (keep,))
+        return cursor.rowcount
+
+    def matches(self, snapshot: int, topology: Topology) -> bool:
+        """Whether a snapshot holds exactly the link table of topology"""
+        stored = {(row[0], row[1]): list(row) for row in self.db.execute(
+            "SELECT switch, interface, speed, remote_host, remote_port, mtu, oper, issues FROM ports "
+            "WHERE snapshot = ?", (snapshot,))}
+        return stored == {(row[0], row[1]): row for row in link_table(topology)}
+
+    def diff(self, old: int, new: int):
+        """Compare two snapshots
+
+        Returns:
+            {change kind: [(switch, interface, remote host, remote port, detail)]}, added,
+            removed and speed mismatches listed once per cable
+        """
+        changes = {}
+        for kind, _, _ in CHANGE_KINDS:
+            if kind == "removed":
+                rows = self.db.execute(_DIFF_QUERIES["added"], {"old": new, "new": old}).fetchall()
+            else:
+                rows = self.db.execute(_DIFF_QUERIES[kind], {"old": old, "new": new}).fetchall()
+            if kind != "oper":
+                # Both ends of a cable report it, keep one row per cable
+                seen = set()
+                unique = []
+                for row in rows:
+                    key = tuple(sorted(((row[0], row[1]), (row[2], row[3]))))
+                    if key not in seen:
+                        seen.add(key)
+                        unique.append(row)
+                rows = unique
+            changes[kind] = rows
+        return changes
+
+    def changed_devices(self, old: int, new: int) -> set:
+        """Devices with any link table row that differs between two snapshots, and their peers"""
+        columns = "switch, interface, speed, remote_host, remote_port, mtu, oper, issues"
+        rows = self.db.execute(
+            f"SELECT switch, remote_host FROM (SELECT {columns} FROM ports WHERE snapshot = :a "
+            f"EXCEPT SELECT {columns} FROM ports WHERE snapshot = :b) "
+            f"UNION SELECT switch, remote_host FROM (SELECT {columns} FROM ports WHERE snapshot = :b "
+            f"EXCEPT SELECT {columns} FROM ports WHERE snapshot = :a)", {"a": old, "b": new})
+        return {device for row in rows for device in row if device}
+
+
+def format_changes(changes, old, new):
+    """Compact, line-oriented change report between two snapshots"""
+    counts = ", ".join(f"{len(changes[kind])} {description}" for kind, _, description in CHANGE_KINDS)
+    lines = [f"📸 Snapshot {new[0]} ({new[1]}) vs {old[0]} ({old[1]}): links {counts}"]
+    for kind, marker, _ in CHANGE_KINDS:
+        for switch, interface, remote_host, remote_port, detail in changes[kind]:
+            line = f"  {marker} {switch}:{interface}"
+            if remote_host:
+                line += f" — {remote_host}:{remote_port}"
+            if detail:
+                line += f": {detail}"
+            lines.append(line)
+    return lines
+
+
+def snapshot_main(args):
+    """--snapshots and --diff-snapshots: answer from the store without reading any dump"""
+    store = SnapshotStore(args.db)
+    try:
+        if args.snapshots:
+            for snapshot, taken, ports, links in store.snapshots():
+                print(f"{snapshot:>6}  {taken}  {ports} ports, {links} links")
+            return
+        try:
+            old, new = (store.resolve(ref) for ref in args.diff_snapshots)
+        except ValueError as e:
+            print(f"❗ {e}")
+            sys.exit(1)
+        rows = dict((row[0], row) for row in store.snapshots())
+        print("\n".join(format_changes(store.diff(old, new), rows[old][:2], rows[new][:2])))
+    finally:
+        store.close()
+
+
+def record_snapshot(topology: Topology, base: str, args):
+    """Store this run's link table, report the changes since the previous run and pick what to re-render
+
+    A link table identical to the latest snapshot, drawn with the same
+    settings, is not stored again.
+
+    Returns:
+        (sites to rebuild with --shard, None for all), whether the outputs are already up to date,
+        and the id of the recorded snapshot (None if nothing was recorded)
+    """
+    settings = json.dumps({"base": base, "dark": args.dark, "group": args.group, "png": args.png,
+                           "pdf": args.pdf, "csv": args.csv, "viewer": args.viewer,
+                           "shard": bool(args.shard or args.site)}, sort_keys=True)
+    store = SnapshotStore(args.db)
+    try:
+        previous = store.latest()
+        if previous is not None and previous[2] == settings and store.matches(previous[0], topology):
+            current = None
+            report = [f"📸 No link changes since snapshot {previous[0]} ({previous[1]}), nothing recorded"]
+            changed = set()
+        else:
+            current = store.record(topology, settings)
+            if previous is None:
+                print(f"📸 Recorded snapshot {current}, the first in {args.db}")
+                return args.site, False, current
+            report = format_changes(store.diff(previous[0], current), previous[:2], store.latest()[:2])
+            changed = store.changed_devices(previous[0], current)
+    finally:
+        store.close()
+
+    print("\n".join(report))
+    report_path = base + "_changes.log"
+    with open(report_path, 'w') as f:
+        f.write("\n".join(report) + "\n")
+    print(f"✅ Change report saved: {report_path}")
+
+    # Outputs drawn with other settings must all be redrawn
+    if args.site or previous[2] != settings:
+        return args.site, False, current
+    if args.shard:
+        sites = shard_sites(topology)
+        shard_dir = os.path.join(os.path.dirname(base), os.path.basename(base) + "_shards")
+        rebuild = {extract_site(device) for device in changed if device in topology.switches}
+        rebuild.update(site for site in sites
+                       if not os.path.exists(os.path.join(shard_dir, shard_file(site) + ".html")))
+        return [site for site in sites if site in rebuild], False, current
+    return None, not changed and os.path.exists(base + ".html"), current
+
+
+def discard_snapshot(path: str, snapshot: int):
+    """Forget a snapshot whose outputs were not rendered, so the next run redraws them"""
+    store = SnapshotStore(path)
+    try:
+        store.discard(snapshot)
+    finally:
+        store.close()
+    print(f"❗ Rendering failed, snapshot {snapshot} discarded from {path}")
+
+
+def prune_snapshots(path: str, keep: int):
+    store = SnapshotStore(path)
+    try:
+        pruned = store.prune(keep)
+    finally:
+        store.close()
+    if pruned:
+        print(f"🧹 Pruned {pruned} snapshot{'s' if pruned != 1 else ''}, keeping the newest {keep} in {path}")
+
+
+def interactive_toggle(prompt_msg):
+    return input(prompt_msg).strip().lower().startswith('y')
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate network topology diagram")
+    parser.add_argument('--dark', action='store_true', help="Dark mode")
+    parser.add_argument('--group', action='store_true', help="Group by site/rack prefix")
+    parser.add_argument('--batch', nargs='?', const='.', metavar='DIR|GLOB',
+                        help="Process the *.txt and *.txt.gz files in DIR (default: current dir) or matching GLOB")
+    parser.add_argument('-i', '--input', action='append', metavar='FILE',
+                        help="Switch dump to read (.gz ok, '-' for stdin), can be repeated")
+    parser.add_argument('--switch', help="Switch name for a pasted dump or stdin")
+    parser.add_argument('--collect', metavar='INVENTORY',
+                        help="Fetch the interface tables over SSH from the switches listed in INVENTORY")
+    parser.add_argument('--collect-command', help=f"Command run on each switch (default: {DEFAULT_COLLECT_COMMAND})")
+    parser.add_argument('--ssh', help="SSH client command, e.g. a local stand-in (default: ssh)")
+    parser.add_argument('--collect-jobs', type=int, help="Switches queried at once (default: 32)")
+    parser.add_argument('--timeout', type=float, help="Seconds per switch and attempt (default: 30)")
+    parser.add_argument('--retries', type=int, help="Retries per switch after a failure or timeout (default: 2)")
+    parser.add_argument('--save-dumps', metavar='DIR', help="Save the collected tables as DIR/<switch>.txt")
+    parser.add_argument('-o', '--output', help="Base name for output files (no extension)")
+    parser.add_argument('--pdf', action='store_true', help="Export PDF")
+    parser.add_argument('--png', action='store_true', help="Export PNG")
+    parser.add_argument('--csv', action='store_true', help="Export CSV")
+    parser.add_argument('--shard', action='store_true',
+                        help="Render one graph per site/rack prefix plus an inter-site summary and index page")
+    parser.add_argument('--site', action='append', metavar='SITE',
+                        help="Only rebuild the shard of SITE (implies --shard), can be repeated")
+    parser.add_argument('--viewer', action='store_true',
+                        help="Write a lazy-loading, pan/zoom/search HTML viewer instead of the embedded SVG page")
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help="Parser processes and parallel shard layouts (default: 0 = one per CPU)")
+    parser.add_argument('--cache-dir', help=f"Directory for the parse cache (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the parse cache")
+    parser.add_argument('--db', metavar='FILE',
+                        help="Record each run's link table in this SQLite snapshot store and only re-render what changed")
+    parser.add_argument('--keep', type=int, metavar='N',
+                        help="Keep only the newest N snapshots in --db (default: all)")
+    parser.add_argument('--snapshots', action='store_true', help="List the snapshots in --db and exit")
+    parser.add_argument('--diff-snapshots', nargs=2, type=int, metavar=('OLD', 'NEW'),
+                        help="Report the changes between two snapshots in --db (ids, or -1 for the latest, -2, ...) and exit")
+    parser.add_argument('--no-input', action='store_true',
+                        help="Never prompt: fail when no dump is given, default the base name and do not open a browser")
+    parser.add_argument('--no-browser', action='store_true', help="Do not open the HTML output in a browser")
+    args = parser.parse_args()
+    if (args.snapshots or args.diff_snapshots or args.keep is not None) and not args.db:
+        parser.error("--snapshots, --diff-snapshots and --keep need --db")
+    if args.keep is not None and args.keep < 1:
+        parser.error("--keep must be at least 1")
+    if args.snapshots or args.diff_snapshots:
+        snapshot_main(args)
+        return
+    if args.viewer and (args.shard or args.site):
+        parser.error("--viewer already loads the fabric site by site and cannot be combined with --shard or --site")
+    if args.no_input and not (args.input or args.batch or args.collect):
+        parser.error("--no-input needs a dump to read from --input, --batch or --collect")
+    if not check_graphviz_installed():
+        print("\n❗ Graphviz executable 'dot' not found in PATH.")
+        print("👉 Download & install from https://graphviz.org/download/")
+        sys.exit(1)
+
+    if not any(vars(args).values()):
+        print("\n✨ No toggles supplied. Example usage for future:")
+        print("   python generate_network_topology_v4.py --dark --group --batch --pdf --png --csv\n")
+        args.dark = interactive_toggle("🌙 Enable dark mode? (y/n): ")
+        args.group = interactive_toggle("🗂️  Group by site/rack prefix? (y/n): ")
+        args.batch = interactive_toggle("📂 Process multiple switch files (*.txt) in folder? (y/n): ")
+        args.pdf = interactive_toggle("📄 Generate PDF output? (y/n): ")
+        args.png = interactive_toggle("🖼️  Generate PNG output? (y/n): ")
+        args.csv = interactive_toggle("📑 Generate CSV link table? (y/n): ")
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    switch_data = {}
+    if args.collect:
+        try:
+            inventory = read_inventory(args.collect)
+        except OSError as e:
+            print(f"❗ Cannot read inventory {args.collect}: {e.strerror}")
+            sys.exit(1)
+        if not inventory:
+            print(f"❗ No switches in {args.collect}")
+            sys.exit(1)
+        start = time.perf_counter()
+        try:
+            switch_data, failed = collect(
+                inventory, ssh=args.ssh or "ssh", command=args.collect_command or DEFAULT_COLLECT_COMMAND,
+                jobs=args.collect_jobs or 32, timeout=args.timeout or 30.0,
+                retries=2 if args.retries is None else args.retries, save_dir=args.save_dumps, progress=print)
+        except CollectError as e:
+            print(f"❗ {e}")
+            sys.exit(1)
+        print(f"📡 Collected {len(switch_data)} of {len(inventory)} switches in {time.perf_counter() - start:.1f}s"
+              f"{f', {len(failed)} failed' if failed else ''}")
+        if not switch_data:
+            sys.exit(1)
+    if args.input or args.batch:
+        files = [path for path in args.input or [] if path != "-"]
+        if args.batch:
+            batch = batch_files('.' if args.batch is True else args.batch)
+            if not batch:
+                print("❗ No .txt files found for batch mode.")
+                sys.exit(1)
+            files += batch
+        # A stdin-only run has no files to ingest or summarize
+        if files:
+            cache = None if args.no_cache else ParseCache(args.cache_dir or DEFAULT_CACHE_DIR)
+            try:
+                ingested, parsed = ingest(files, jobs=jobs, cache=cache, progress=print)
+                switch_data.update(ingested)
+            except OSError as e:
+                print(f"❗ Cannot read {e.filename}: {e.strerror}")
+                sys.exit(1)
+            if cache is not None:
+                cache.save(progress=print)
+            print(f"📂 {len(files)} switch files: {parsed} parsed, {len(files) - parsed} from cache")
+        if "-" in (args.input or []):
+            switch_data[args.switch or "Switch1"] = parse_dump("-")
+    elif not args.collect:
+        print("\n📋 Paste switch interface output. End with an empty line:")
+        lines = []
+        while True:
+            line = input()
+            if not line.strip():
+                break
+            lines.append(line)
+        sw = args.switch or input("🖋️  Enter switch name: ").strip() or "Switch1"
+        switch_data[sw] = list(iter_interfaces(lines))
+
+    base_name = args.output
+    if not base_name and not args.no_input:
+        base_name = input("💾 Base name for output files (no extension): ").strip()
+    base_name = base_name or "network_topology"
+    topology = Topology.from_switch_data(switch_data)
+    only_sites = args.site
+    snapshot = None
+    if args.db:
+        only_sites, up_to_date, snapshot = record_snapshot(topology, base_name, args)
+        if up_to_date:
+            print(f"♻️  No link changes since the last snapshot, {base_name}.html is up to date")
+            return
+    try:
+        if args.viewer:
+            html_path = build_viewer_outputs(topology, base_name, dark=args.dark, grouped=args.group,
+                                             save_pdf=args.pdf, save_png=args.png, save_csv=args.csv,
+                                             progress=print)
+        elif args.shard or args.site:
+            html_path = build_sharded_outputs(topology, base_name, dark=args.dark, grouped=args.group,
+                                              save_pdf=args.pdf, save_png=args.png, save_csv=args.csv,
+                                              only_sites=only_sites, jobs=jobs, progress=print)
+        else:
+            html_path = build_outputs(topology, base_name, dark=args.dark, grouped=args.group,
+                                      save_pdf=args.pdf, save_png=args.png, save_csv=args.csv, progress=print)
+    except BaseException:
+        # A snapshot stands for drawn outputs, keep none the outputs do not match
+        if snapshot is not None:
+            discard_snapshot(args.db, snapshot)
+        raise
+    if snapshot is not None and args.keep:
+        prune_snapshots(args.db, args.keep)
+    if not (args.no_browser or args.no_input):
+        open_in_browser(html_path)
+
+if __name__ == "__main__":
+    main()
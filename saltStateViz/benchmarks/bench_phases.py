@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Phase benchmark for salt_state_visualizer.py
+
+Generates synthetic salt trees of increasing size with gen_salt_tree.py and
+times the phases of a run on each of them: indexing the tree, parsing it
+(serially, with a process pool and through a cold and a warm parse cache)
+and generating the ASCII and graphviz output. --startup also times fresh
+interpreters importing the module and running --help, and lists the heavy
+dependencies a plain import pulls in. Results can be saved as JSON and
+compared against a stored baseline to catch regressions.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+import salt_state_visualizer as ssv  # noqa: E402
+from gen_salt_tree import generate_tree  # noqa: E402
+
+DEFAULT_SIZES = '10,100,1000,10000,50000'
+PHASES = ['find_whole_states', 'parse_state_files', 'parse_state_files_jobs', 'parse_cache_cold',
+          'parse_cache_warm', 'generate_ascii_diagram', 'generate_graphviz']
+# Fresh interpreters timed by --startup: a bare one, a plain import and --help
+MODULE = 'salt_state_visualizer'
+STARTUP_COMMANDS = {
+    'interpreter': ['-c', 'pass'],
+    'import': ['-c', f'import {MODULE}'],
+    'help': [os.path.join(BENCH_DIR, '..', 'salt_state_visualizer.py'), '--help'],
+}
+# Optional heavy dependencies that a plain import should leave alone
+HEAVY_MODULES = ['yaml', 'graphviz', 'cProfile', 'pstats', 'ctypes', 'multiprocessing', 'concurrent.futures.process']
+
+
+def _indexed(salt_path):
+    """Create a visualizer with the tree already indexed"""
+    visualizer = ssv.SaltStateVisualizer(salt_path)
+    visualizer.find_whole_states()
+    return visualizer
+
+
+def run_phases(salt_path, jobs, repeat, graphviz, work_dir):
+    """Time every phase on one tree
+
+    Returns:
+        Dict mapping phase name to the best wall time in seconds
+    """
+    timings = {}
+
+    def best_of(phase, setup, func):
+        best = None
+        for _ in range(repeat):
+            arg = setup()
+            start = time.perf_counter()
+            func(arg)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[phase] = best
+
+    best_of('find_whole_states', lambda: ssv.SaltStateVisualizer(salt_path), lambda v: v.find_whole_states())
+    best_of('parse_state_files', lambda: _indexed(salt_path), lambda v: v.parse_state_files())
+    if jobs > 1:
+        best_of('parse_state_files_jobs', lambda: _indexed(salt_path), lambda v: v.parse_state_files(jobs=jobs))
+
+    cache_dir = os.path.join(work_dir, 'cache')
+
+    def cold_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return _indexed(salt_path), ssv.ParseCache(cache_dir)
+
+    def parse_cached(args):
+        visualizer, cache = args
+        visualizer.parse_state_files(jobs=jobs, cache=cache)
+        cache.save()
+
+    best_of('parse_cache_cold', cold_cache, parse_cached)
+    best_of('parse_cache_warm', lambda: (_indexed(salt_path), ssv.ParseCache(cache_dir)), parse_cached)
+
+    visualizer = _indexed(salt_path)
+    visualizer.parse_state_files(jobs=jobs)
+    best_of('generate_ascii_diagram', lambda: visualizer, lambda v: v.generate_ascii_diagram())
+    if graphviz:
+        output = os.path.join(work_dir, 'graph')
+        best_of('generate_graphviz', lambda: visualizer,
+                lambda v: v.generate_graphviz(output_file=output, jobs=jobs))
+    timings['yaml'] = dict(visualizer.yaml_stats)
+    timings['fact_store'] = visualizer.facts.memory_footprint()
+    timings['states'] = len(visualizer.states)
+    return timings
+
+
+def measure_startup(repeat):
+    """Time fresh interpreters importing the module and running --help
+
+    A first untimed import writes the bytecode cache, so the numbers are
+    those of an installed tool rather than of the first run after an edit.
+
+    Returns:
+        {'seconds': {command: best wall time}, 'heavy_modules': [HEAVY_MODULES loaded by the import]}
+    """
+    import subprocess
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.join(BENCH_DIR, '..'), env.get('PYTHONPATH')]))
+
+    def best_of(argv):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *argv], env=env, stdout=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    subprocess.run([sys.executable, *STARTUP_COMMANDS['import']], env=env, check=True)
+    seconds = {name: best_of(argv) for name, argv in STARTUP_COMMANDS.items()}
+    code = f"import sys, {MODULE}; print('\\n'.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    loaded = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return {'seconds': seconds, 'heavy_modules': loaded.stdout.split()}
+
+
+def print_startup(startup):
+    """Print the startup timings and their overhead over a bare interpreter"""
+    bare = startup['seconds']['interpreter']
+    print()
+    for name, seconds in startup['seconds'].items():
+        extra = '' if name == 'interpreter' else f" (+{(seconds - bare) * 1000:.1f} ms)"
+        print(f"{name:<12} {seconds * 1000:>8.1f} ms{extra}")
+    print(f"Heavy modules loaded by the import: {', '.join(startup['heavy_modules']) or 'none'}")
+
+
+def run(args):
+    """Generate the trees and benchmark them
+
+    Returns:
+        Results document
+    """
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    graphviz = not args.no_graphviz and ssv.check_graphviz_installed()
+    if not args.no_graphviz and not graphviz:
+        print("Graphviz executables not found, skipping generate_graphviz", file=sys.stderr)
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'yaml_loader': ssv.yaml_loader()[1],
+            'cpus': os.cpu_count(),
+            'jobs': jobs,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'files_per_state': args.files_per_state,
+            'depth': args.depth,
+            'jinja': args.jinja,
+        },
+        'sizes': [],
+    }
+
+    base_dir = args.work_dir or tempfile.mkdtemp(prefix='saltviz-bench-')
+    try:
+        for files in [int(size) for size in args.sizes.split(',')]:
+            states = max(1, files // args.files_per_state)
+            tree = os.path.join(base_dir, f"tree-{files}-f{args.files_per_state}-d{args.depth}"
+                                          f"-j{args.jinja}-s{args.seed}")
+            if not os.path.isdir(tree):
+                print(f"Generating {states} states x {args.files_per_state} files...", file=sys.stderr)
+                generate_tree(tree, states=states, depth=args.depth, files_per_state=args.files_per_state,
+                              jinja=args.jinja, seed=args.seed)
+            print(f"Benchmarking {files} files...", file=sys.stderr)
+            timings = run_phases(tree, jobs, args.repeat, graphviz, os.path.join(base_dir, f"work-{files}"))
+            results['sizes'].append({
+                'files': files,
+                'states': timings.pop('states'),
+                'yaml': timings.pop('yaml'),
+                'fact_store': timings.pop('fact_store'),
+                'phases': timings,
+            })
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    if args.startup:
+        print("Timing startup...", file=sys.stderr)
+        results['startup'] = measure_startup(args.repeat)
+    return results
+
+
+def print_results(results):
+    """Print a table of the phase timings in milliseconds"""
+    phases = [phase for phase in PHASES if any(phase in size['phases'] for size in results['sizes'])]
+    print(f"{'files':>8} {'states':>8} " + ' '.join(f"{phase:>22}" for phase in phases))
+    for size in results['sizes']:
+        cells = []
+        for phase in phases:
+            seconds = size['phases'].get(phase)
+            cells.append(f"{'-' if seconds is None else f'{seconds * 1000:.1f} ms':>22}")
+        print(f"{size['files']:>8} {size['states']:>8} " + ' '.join(cells))
+
+
+def compare(results, baseline, threshold, min_time):
+    """Compare results with a baseline and print the changes
+
+    Returns:
+        List of (files, phase, baseline seconds, current seconds) regressions
+    """
+    differing = sorted(key for key, value in results['meta'].items() if baseline['meta'].get(key) != value)
+    if differing:
+        print(f"Warning: baseline was recorded with different settings: {', '.join(differing)}", file=sys.stderr)
+
+    base_sizes = {size['files']: size for size in baseline['sizes']}
+    regressions = []
+    print(f"\n{'files':>8} {'phase':<24} {'baseline':>12} {'current':>12} {'change':>8}")
+    for size in results['sizes']:
+        base = base_sizes.get(size['files'])
+        if base is None:
+            continue
+        for phase in PHASES:
+            if phase not in size['phases'] or phase not in base['phases']:
+                continue
+            old, new = base['phases'][phase], size['phases'][phase]
+            change = (new - old) / old if old else 0.0
+            # Ignore phases too fast to be measured reliably
+            regressed = change > threshold and new >= min_time
+            if regressed:
+                regressions.append((size['files'], phase, old, new))
+            print(f"{size['files']:>8} {phase:<24} {old * 1000:>9.1f} ms {new * 1000:>9.1f} ms "
+                  f"{change * 100:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    if 'startup' in results and 'startup' in baseline:
+        for command in ('import', 'help'):
+            old, new = baseline['startup']['seconds'][command], results['startup']['seconds'][command]
+            change = (new - old) / old if old else 0.0
+            regressed = change > threshold and new >= min_time
+            if regressed:
+                regressions.append(('startup', command, old, new))
+            print(f"{'startup':>8} {command:<24} {old * 1000:>9.1f} ms {new * 1000:>9.1f} ms "
+                  f"{change * 100:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the phases of salt_state_visualizer.py')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'Comma separated tree sizes in files (default: {DEFAULT_SIZES})')
+    parser.add_argument('-f', '--files-per-state', type=int, default=4, help='.sls files per state (default: 4)')
+    parser.add_argument('-d', '--depth', type=int, default=3, help='Maximum nesting depth (default: 3)')
+    parser.add_argument('--jinja', type=float, default=0.5, help='Fraction of files with Jinja conditionals (default: 0.5)')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='Processes for the parallel phases (0 = one per CPU, default: 0)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions, best time is reported (default: 3)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the trees (default: 1)')
+    parser.add_argument('--no-graphviz', action='store_true', help='Skip the generate_graphviz phase')
+    parser.add_argument('--work-dir', help='Keep generated trees in this directory and reuse them across runs')
+    parser.add_argument('--startup', action='store_true', help='Also time the import and --help in fresh interpreters')
+    parser.add_argument('-o', '--output', help='Save the results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare with the results saved in BASELINE')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Slowdown flagged as a regression (default: 0.2 = 20%%)')
+    parser.add_argument('--min-time', type=float, default=0.005, help='Ignore phases faster than this many seconds (default: 0.005)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    print_results(results)
+    if 'startup' in results:
+        print_startup(results['startup'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold * 100:.0f}%", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the single-pass fact scanner
+
+Compares the per-file cost of the legacy extraction (two template rewrites
+followed by one re.findall() pass per pattern) with the precompiled
+Scanner used by salt_state_visualizer.py on a synthetic corpus of .sls
+files, and checks that both produce the same facts.
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import salt_state_visualizer as ssv  # noqa: E402
+
+LEGACY_PATTERNS = [
+    ('roles', r'role\s*:\s*([^\n]+)'),
+    ('role_dependencies', r'salt\.pixpillar\.nodehasrole\([\'"]([^\'"]+)[\'"]\)'),
+    ('pillars', r'salt\.pillar\.get\([\'"]([^\'"]+)[\'"]\)'),
+    ('systemd_units', r'service\.running:\s*\n\s*-\s*name:\s*([^\n]+)'),
+    ('systemd_units', r'([^:\n]+):\s*\n\s*service\.running'),
+    ('systemd_units', r'systemd\.[^:]+:\s*\n\s*-\s*name:\s*([^\n]+)'),
+    ('systemd_units', r'service\.disabled:\s*\n\s*-\s*name:\s*([^\n]+)'),
+    ('systemd_units', r'([^:\n]+):\s*\n\s*service\.running'),
+    ('systemd_units', r'systemctl\s+enable\s+([^\s&;]+)'),
+    ('systemd_units', r'systemctl\s+disable\s+([^\s&;]+)'),
+    ('systemd_units', r'(ap-analytics@\*\.timer)'),
+    ('systemd_units', r'([\w@\.-]+@<[^>]+>\.(timer|service))'),
+]
+
+SERVICES = ['chronyd', 'sshd', 'nginx', 'rsyslog', 'crond', 'gpfs', 'nfs-server', 'lldpd']
+
+
+def legacy_extract(content):
+    """Extraction as done before the scanner: one findall pass per pattern"""
+    content = re.sub(r'@\{\{\s*([^\}]+)\s*\}\}', r'@<\1>', content)
+    content = re.sub(r'\{\{\s*([^\}]+)\s*\}\}', r'<\1>', content)
+    facts = {'roles': [], 'role_dependencies': [], 'pillars': set(), 'systemd_units': set()}
+    for kind, pattern in LEGACY_PATTERNS:
+        for match in re.findall(pattern, content):
+            value = (match[0] if isinstance(match, tuple) else match).strip()
+            if kind in ('roles', 'role_dependencies'):
+                if value not in facts[kind]:
+                    facts[kind].append(value)
+            else:
+                facts[kind].add(value)
+    return facts
+
+
+def scanner_extract(content):
+    """Extraction through the precompiled single-pass scanner"""
+    content = ssv._standardize_templates(content)
+    facts = {'roles': [], 'role_dependencies': [], 'pillars': set(), 'systemd_units': set()}
+    matches = ssv.SCANNER.scan(content)
+    for ext in ssv.SCANNER.extractors:
+        for value in matches[ext.name]:
+            if ext.kind in ('roles', 'role_dependencies'):
+                if value not in facts[ext.kind]:
+                    facts[ext.kind].append(value)
+            else:
+                facts[ext.kind].add(value)
+    return facts
+
+
+def synthetic_sls(rng, idx, blocks):
+    """Generate the content of one synthetic state file"""
+    lines = [f"# Managed by salt - state {idx}", "#", ""]
+    jinja = rng.random() < 0.6
+    if jinja:
+        lines.append(f"{{% if salt.pixpillar.nodehasrole('role{rng.randint(0, 9)}') %}}")
+    for block in range(blocks):
+        choice = rng.random()
+        name = f"state{idx}_{block}"
+        if choice < 0.25:
+            service = rng.choice(SERVICES)
+            lines += [f"{service}:", "  service.running:", f"    - name: {service}", "    - enable: True"]
+        elif choice < 0.4:
+            lines += [f"{name}_unit:", "  systemd.unit_file:", f"    - name: {name}.service"]
+        elif choice < 0.55:
+            lines += [f"{name}_conf:", "  file.managed:", f"    - name: /etc/{name}.conf",
+                      f"    - contents: {{{{ salt.pillar.get('{name}:value') }}}}"]
+        elif choice < 0.65:
+            lines += [f"{name}_timer:", "  cmd.run:",
+                      "    - name: systemctl enable ap-analytics@{{ filesystem }}.timer && systemctl disable old.service"]
+        elif choice < 0.7:
+            lines += [f"{name}_grain:", "  grains.present:", f"    - role: role{rng.randint(0, 9)}"]
+        else:
+            lines += [f"{name}_pkg:", "  pkg.installed:", "    - pkgs:"]
+            lines += [f"      - package-{name}-{n}" for n in range(rng.randint(2, 8))]
+        lines.append("")
+    if jinja:
+        lines.append("{% endif %}")
+    return "\n".join(lines) + "\n"
+
+
+def bench(func, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in corpus:
+            func(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the saltStateViz fact scanner')
+    parser.add_argument('-n', '--files', type=int, default=2000, help='Number of synthetic files (default: 2000)')
+    parser.add_argument('-b', '--blocks', type=int, default=12, help='State blocks per file (default: 12)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Repetitions, best time is reported (default: 5)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the corpus (default: 1)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [synthetic_sls(rng, idx, args.blocks) for idx in range(args.files)]
+
+    for content in corpus:
+        if legacy_extract(content) != scanner_extract(content):
+            print("Scanner output differs from the legacy extraction", file=sys.stderr)
+            sys.exit(1)
+
+    total_bytes = sum(len(content) for content in corpus)
+    legacy = bench(legacy_extract, corpus, args.repeat)
+    scanner = bench(scanner_extract, corpus, args.repeat)
+    print(f"Corpus: {len(corpus)} files, {total_bytes / 1024:.0f} KiB")
+    print(f"legacy findall passes: {legacy / len(corpus) * 1e6:8.1f} us/file")
+    print(f"single-pass scanner:   {scanner / len(corpus) * 1e6:8.1f} us/file")
+    print(f"speedup:               {legacy / scanner:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic SaltStack tree generator
+
+Writes a tree of states shaped like a real salt tree: nested state
+directories with an init.sls and further .sls files each, include blocks,
+Jinja conditionals and a configurable mix of pillar lookups, services,
+systemd units and plain package/file states. The same arguments and seed
+always produce the same tree, so benchmark runs are comparable.
+"""
+
+import os
+import sys
+import random
+import argparse
+
+SERVICES = ['chronyd', 'sshd', 'nginx', 'rsyslog', 'crond', 'gpfs', 'nfs-server', 'lldpd']
+ROLES = ['mgmt', 'nsd', 'client', 'gateway', 'analytics']
+
+
+def _block(rng, state, idx, pillars, services):
+    """Generate one state block of an .sls file"""
+    name = f"{state.replace('.', '_')}_{idx}"
+    choice = rng.random()
+    if choice < pillars:
+        return (f"{name}_conf:\n  file.managed:\n    - name: /etc/{name}.conf\n"
+                f"    - contents: {{{{ salt.pillar.get('{state}:{name}') }}}}\n")
+    choice -= pillars
+    if choice < services:
+        kind = rng.random()
+        if kind < 0.5:
+            service = rng.choice(SERVICES)
+            return f"{service}:\n  service.running:\n    - name: {service}\n    - enable: True\n"
+        if kind < 0.75:
+            return f"{name}_unit:\n  systemd.unit_file:\n    - name: {name}.service\n"
+        if kind < 0.9:
+            return (f"{name}_enable:\n  cmd.run:\n"
+                    f"    - name: systemctl enable ap-analytics@{{{{ filesystem }}}}.timer && systemctl disable {name}.service\n")
+        return f"{name}_disabled:\n  service.disabled:\n    - name: {rng.choice(SERVICES)}\n"
+    if rng.random() < 0.1:
+        return f"{name}_grain:\n  grains.present:\n    - role: {rng.choice(ROLES)}\n"
+    packages = ''.join(f"      - {name}-pkg{n}\n" for n in range(rng.randint(1, 6)))
+    return f"{name}_pkg:\n  pkg.installed:\n    - pkgs:\n{packages}"
+
+
+def _sls(rng, state, blocks, jinja, pillars, services):
+    """Generate the content of one .sls file"""
+    parts = ["# Managed by salt\n\n"]
+    wrapped = rng.random() < jinja
+    if wrapped:
+        parts.append(f"{{% if salt.pixpillar.nodehasrole('{rng.choice(ROLES)}') %}}\n")
+    for idx in range(blocks):
+        parts.append(_block(rng, state, idx, pillars, services))
+        parts.append("\n")
+    if wrapped:
+        parts.append("{% endif %}\n")
+    return ''.join(parts)
+
+
+def generate_tree(root, states=100, depth=2, files_per_state=3, blocks=6, jinja=0.5,
+                  includes=0.6, pillars=0.2, services=0.3, seed=1):
+    """Write a synthetic salt tree to root
+
+    Args:
+        root: Directory to create the tree in
+        states: Number of states (directories with an init.sls)
+        depth: Maximum nesting depth of states
+        files_per_state: Number of .sls files per state, including init.sls
+        blocks: State blocks per .sls file
+        jinja: Fraction of files wrapped in a Jinja conditional
+        includes: Fraction of init.sls files with an include block
+        pillars: Fraction of blocks reading a pillar
+        services: Fraction of blocks managing a service or systemd unit
+        seed: Random seed
+
+    Returns:
+        Number of .sls files written
+    """
+    rng = random.Random(seed)
+    levels = [[] for _ in range(depth)]
+    all_states = []
+    written = 0
+    for idx in range(states):
+        level = rng.randrange(depth)
+        while level and not levels[level - 1]:
+            level -= 1
+        parent = rng.choice(levels[level - 1]) if level else None
+        state = f"{parent}.s{idx}" if parent else f"s{idx}"
+        levels[level].append(state)
+
+        state_dir = os.path.join(root, *state.split('.'))
+        os.makedirs(state_dir, exist_ok=True)
+
+        include = ''
+        if all_states and rng.random() < includes:
+            # Only include earlier states so the include graph stays acyclic
+            targets = sorted({rng.choice(all_states) for _ in range(rng.randint(1, 3))})
+            if files_per_state > 1:
+                targets.append('.f1')
+            include = 'include:\n' + ''.join(f"  - {target}\n" for target in targets) + '\n'
+        all_states.append(state)
+
+        with open(os.path.join(state_dir, 'init.sls'), 'w') as f:
+            f.write(include + _sls(rng, state, blocks, jinja, pillars, services))
+        for file_idx in range(1, files_per_state):
+            with open(os.path.join(state_dir, f"f{file_idx}.sls"), 'w') as f:
+                f.write(_sls(rng, state, blocks, jinja, pillars, services))
+        written += files_per_state
+
+    with open(os.path.join(root, 'top.sls'), 'w') as f:
+        f.write("base:\n  '*':\n" + ''.join(f"    - {state}\n" for state in levels[0][:20]))
+    return written + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic SaltStack tree')
+    parser.add_argument('root', help='Directory to create the tree in (must not exist)')
+    parser.add_argument('-s', '--states', type=int, default=100, help='Number of states (default: 100)')
+    parser.add_argument('-d', '--depth', type=int, default=2, help='Maximum nesting depth (default: 2)')
+    parser.add_argument('-f', '--files-per-state', type=int, default=3, help='.sls files per state (default: 3)')
+    parser.add_argument('-b', '--blocks', type=int, default=6, help='State blocks per file (default: 6)')
+    parser.add_argument('--jinja', type=float, default=0.5, help='Fraction of files with Jinja conditionals (default: 0.5)')
+    parser.add_argument('--includes', type=float, default=0.6, help='Fraction of states with includes (default: 0.6)')
+    parser.add_argument('--pillars', type=float, default=0.2, help='Fraction of blocks reading pillars (default: 0.2)')
+    parser.add_argument('--services', type=float, default=0.3, help='Fraction of blocks managing services (default: 0.3)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.root):
+        print(f"Error: {args.root} already exists", file=sys.stderr)
+        sys.exit(1)
+    files = generate_tree(args.root, states=args.states, depth=args.depth, files_per_state=args.files_per_state,
+                          blocks=args.blocks, jinja=args.jinja, includes=args.includes, pillars=args.pillars,
+                          services=args.services, seed=args.seed)
+    print(f"Wrote {files} .sls files for {args.states} states to {args.root}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,357 +10,1569 @@ and their dependencies.
 import os
 import sys
 import re
+import time
+import select
+import struct
 import subprocess
 import argparse
-import yaml
-import graphviz
-from collections import defaultdict
+import hashlib
+import json
+from collections import Counter, defaultdict, namedtuple
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+
+_yaml_loader = None
+
+
+def yaml_loader():
+    """Import PyYAML on first use and pick its loader
+
+    PyYAML is only imported once a file has to be loaded as YAML, so runs
+    that skip every load and programs embedding this module do not pay for
+    it at startup.
+
+    Returns:
+        Tuple of (loader class, loader name)
+    """
+    global _yaml_loader
+    if _yaml_loader is None:
+        import yaml
+        # Use the libyaml bindings when available, they are an order of magnitude faster
+        if hasattr(yaml, 'CSafeLoader'):
+            _yaml_loader = (yaml.CSafeLoader, 'libyaml')
+        else:
+            _yaml_loader = (yaml.SafeLoader, 'python')
+    return _yaml_loader
+
+
+def _new_facts():
+    """Create an empty per-file facts record"""
+    return {
+        'roles': [],
+        'role_dependencies': [],
+        'pillars': set(),
+        'systemd_units': set(),
+        'includes': set(),
+        'yaml': None,
+    }
+
+
+def _finalize_facts(facts):
+    """Convert a facts record to plain lists so it can cross process boundaries"""
+    return {
+        'roles': facts['roles'],
+        'role_dependencies': facts['role_dependencies'],
+        'pillars': list(facts['pillars']),
+        'systemd_units': list(facts['systemd_units']),
+        'includes': list(facts['includes']),
+        'yaml': facts['yaml'],
+    }
+
+
+def _parse_job(job, cost=None):
+    """Parse a single state file and return its facts
+
+    Args:
+        job: Tuple of (state, file_path, is_init); includes are only read from init.sls
+        cost: Optional dict to record the time spent in each step of the parse in
+
+    Returns:
+        Tuple of (content digest, facts); the digest is None if the file could not be read
+    """
+    state, file_path, is_init = job
+    start = time.perf_counter()
+    try:
+        with open(file_path, 'r') as f:
+            content = f.read()
+    except Exception as e:
+        print(f"Error parsing file {file_path}: {e}", file=sys.stderr)
+        return None, _finalize_facts(_new_facts())
+    if cost is not None:
+        cost['read'] = time.perf_counter() - start
+        cost['bytes'] = len(content)
+    facts = _new_facts()
+    _parse_file(content, state, facts, file_path, with_includes=is_init, cost=cost)
+    return _content_digest(content), _finalize_facts(facts)
+
+
+def _timed_parse_job(job):
+    """Parse a single state file, measuring what it costs
+
+    Returns:
+        Tuple of (content digest, facts, cost)
+    """
+    cost = {}
+    wall, cpu = time.perf_counter(), time.process_time()
+    digest, facts = _parse_job(job, cost)
+    cost['wall'] = time.perf_counter() - wall
+    cost['cpu'] = time.process_time() - cpu
+    return digest, facts, cost
+
+
+def parse_content(content, state, is_init, file_path='<string>'):
+    """Extract the facts of a single state file from its content"""
+    facts = _new_facts()
+    _parse_file(content, state, facts, file_path, with_includes=is_init)
+    return _finalize_facts(facts)
+
+
+def _content_digest(content):
+    """Hash file content for change detection"""
+    return hashlib.sha1(content.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+Extractor = namedtuple('Extractor', ['name', 'kind', 'trigger', 'regex', 'locate'])
+
+
+class Scanner:
+    """Single-pass extractor for the facts found in state files
+
+    Every extractor is keyed by a literal trigger that all of its matches contain.
+    The triggers are compiled into one alternation that is searched over the text
+    once, and each hit is handed to the extractors registered for that trigger.
+    Per extractor the results are the same as re.findall(): leftmost,
+    non-overlapping matches.
+    """
+
+    def __init__(self):
+        self.extractors = []
+        self._regex = None
+        self._by_trigger = {}
+
+    def register(self, name, kind, trigger, pattern, locate=None):
+        """Register an extractor
+
+        Args:
+            name: Unique name of the extractor
+            kind: Fact kind the values are recorded as (roles, pillars, systemd_units, ...)
+            trigger: Literal text contained in every match of pattern
+            pattern: Regular expression whose first group is the extracted value
+            locate: For patterns that start before their trigger, a function
+                (text, trigger_pos, floor) returning the start of the match that
+                contains the trigger, or None. Matches start at the trigger otherwise.
+        """
+        if any(ext.name == name for ext in self.extractors):
+            raise ValueError(f"Extractor {name} is already registered")
+        self.extractors.append(Extractor(name, kind, trigger, re.compile(pattern), locate))
+        self._regex = None
+
+    def _compile(self):
+        triggers = sorted({ext.trigger for ext in self.extractors}, key=len, reverse=True)
+        self._regex = re.compile('|'.join(re.escape(trigger) for trigger in triggers))
+        # A hit on a longer trigger also counts for triggers that are a prefix of it
+        self._by_trigger = {
+            trigger: [idx for idx, ext in enumerate(self.extractors) if trigger.startswith(ext.trigger)]
+            for trigger in triggers
+        }
+
+    def scan(self, text):
+        """Scan text once and return the extracted values
+
+        Returns:
+            Dict mapping extractor name to the list of stripped values in text order
+        """
+        if self._regex is None:
+            self._compile()
+        extractors = self.extractors
+        by_trigger = self._by_trigger
+        results = {ext.name: [] for ext in extractors}
+        last_end = [0] * len(extractors)
+
+        search = self._regex.search
+        hit = search(text)
+        while hit:
+            pos = hit.start()
+            for idx in by_trigger[hit.group()]:
+                ext = extractors[idx]
+                floor = last_end[idx]
+                start = pos if ext.locate is None else ext.locate(text, pos, floor)
+                if start is None or start < floor:
+                    continue
+                match = ext.regex.match(text, start)
+                if match:
+                    results[ext.name].append(match.group(1).strip())
+                    last_end[idx] = match.end()
+            # Triggers may overlap, so resume right after the start of this one
+            hit = search(text, pos + 1)
+        return results
+
+
+def _locate_service_id(text, pos, floor):
+    """Start of the 'id:' line a service.running trigger is declared under"""
+    colon = pos - 1
+    while colon >= floor and text[colon].isspace():
+        colon -= 1
+    if colon <= floor or text[colon] != ':':
+        return None
+    start = max(floor, text.rfind(':', floor, colon) + 1, text.rfind('\n', floor, colon) + 1)
+    return start if start < colon else None
+
+
+def _locate_templated_unit(text, pos, floor):
+    """Start of the unit name in front of a templated '@<' trigger"""
+    start = pos
+    while start > floor and (text[start - 1].isalnum() or text[start - 1] in '_@.-'):
+        start -= 1
+    return start if start < pos else None
+
+
+SCANNER = Scanner()
+SCANNER.register('role', 'roles', 'role', r'role\s*:\s*([^\n]+)')
+# Role dependencies (roles used in conditional blocks)
+SCANNER.register('nodehasrole', 'role_dependencies', 'salt.pixpillar.nodehasrole(',
+                 r'salt\.pixpillar\.nodehasrole\([\'"]([^\'"]+)[\'"]\)')
+# Pillar dependencies (pillars accessed via salt.pillar.get)
+SCANNER.register('pillar_get', 'pillars', 'salt.pillar.get(', r'salt\.pillar\.get\([\'"]([^\'"]+)[\'"]\)')
+# Systemd units: service.running with a name field
+SCANNER.register('service_running_name', 'systemd_units', 'service.running',
+                 r'service\.running:\s*\n\s*-\s*name:\s*([^\n]+)')
+# Systemd units: IDs with a service.running declaration nested under them
+SCANNER.register('service_running_id', 'systemd_units', 'service.running',
+                 r'([^:\n]+):\s*\n\s*service\.running', locate=_locate_service_id)
+# Systemd units: systemd.* states with a name field
+SCANNER.register('systemd_name', 'systemd_units', 'systemd.', r'systemd\.[^:]+:\s*\n\s*-\s*name:\s*([^\n]+)')
+# Systemd units: service.disabled states
+SCANNER.register('service_disabled_name', 'systemd_units', 'service.disabled',
+                 r'service\.disabled:\s*\n\s*-\s*name:\s*([^\n]+)')
+# Systemd units: enable/disable statements
+SCANNER.register('systemctl_enable', 'systemd_units', 'systemctl', r'systemctl\s+enable\s+([^\s&;]+)')
+SCANNER.register('systemctl_disable', 'systemd_units', 'systemctl', r'systemctl\s+disable\s+([^\s&;]+)')
+# Systemd units: specific timer patterns
+SCANNER.register('analytics_timer', 'systemd_units', 'ap-analytics@*.timer', r'(ap-analytics@\*\.timer)')
+# Systemd units: templated unit names (after templated variables became @<var>)
+SCANNER.register('templated_unit', 'systemd_units', '@<', r'([\w@\.-]+@<[^>]+>\.(timer|service))',
+                 locate=_locate_templated_unit)
+
+_LEADING_COMMENTS_RE = re.compile(r'^#.*?(?=^[^#])', flags=re.DOTALL | re.MULTILINE)
+_AT_TEMPLATE_RE = re.compile(r'@\{\{\s*([^\}]+)\s*\}\}')
+_TEMPLATE_RE = re.compile(r'\{\{\s*([^\}]+)\s*\}\}')
+_INCLUDE_BLOCK_RE = re.compile(r'include:\s*\n((?:\s*-\s*.*\n)+)')
+_INCLUDE_ITEM_RE = re.compile(r'-\s*(.*)')
+
+
+# YAML load outcomes, counted per run
+YAML_PARSED = 'parsed'
+YAML_FAILED = 'failed'
+YAML_SKIPPED_NO_TARGETS = 'skipped_no_targets'
+YAML_SKIPPED_JINJA = 'skipped_jinja'
+
+_JINJA_LINE_RE = re.compile(r'^\{[%{]', re.MULTILINE)
+
+
+def _yaml_has_targets(content):
+    """Whether the YAML of a file could contain service.running or systemd.* states
+
+    Without the literal text (or a backslash escape that could spell it in a
+    double-quoted key) _extract_from_yaml cannot find anything.
+    """
+    return 'service.running' in content or 'systemd.' in content or '\\' in content
+
+
+def _jinja_breaks_yaml(content):
+    """Whether a Jinja tag guarantees that the file fails to load as YAML
+
+    A {% ... %} or {{ ... }} tag at the start of a line is always a YAML error
+    unless it continues a quoted scalar opened on an earlier line, so the check
+    gives up at the first line that could leave a quote open.
+    """
+    marker = _JINJA_LINE_RE.search(content)
+    if marker is None:
+        return False
+    for line in content[:marker.start()].splitlines():
+        if line.lstrip().startswith('#'):
+            continue
+        if line.count('"') % 2 or line.count("'") % 2 or '\\"' in line:
+            return False
+    return True
+
+
+def _load_yaml(content):
+    """Load a state file as YAML, skipping loads that cannot contribute
+
+    Returns:
+        Tuple of (data or None, outcome)
+    """
+    if not _yaml_has_targets(content):
+        return None, YAML_SKIPPED_NO_TARGETS
+    if _jinja_breaks_yaml(content):
+        return None, YAML_SKIPPED_JINJA
+    try:
+        # Skip the first part if it's a comment block
+        if content.startswith('#') or '\n#' in content:
+            content = _LEADING_COMMENTS_RE.sub('', content)
+        import yaml
+        return yaml.load(content, Loader=yaml_loader()[0]), YAML_PARSED
+    except Exception:
+        # Fallback to regex parsing if YAML parsing fails
+        return None, YAML_FAILED
+
+
+def _standardize_templates(content):
+    """Rewrite templated variables ({{ var }}) to <var>"""
+    if '{{' not in content:
+        return content
+    content = _AT_TEMPLATE_RE.sub(r'@<\1>', content)
+    # Make sure to standardize any remaining templated variables
+    return _TEMPLATE_RE.sub(r'<\1>', content)
+
+
+def _parse_includes(content, state, facts, file_path):
+    """Parse include statements from a (template standardized) state file"""
+    try:
+        include_match = _INCLUDE_BLOCK_RE.search(content)
+        if include_match:
+            includes_block = include_match.group(1)
+            includes = _INCLUDE_ITEM_RE.findall(includes_block)
+
+            includes_set = set(include.strip() for include in includes)
+            includes_set = {include if not include.startswith('.') else f"{state}{include}" for include in includes_set}
+            facts['includes'].update(includes_set)
+    except Exception as e:
+        print(f"Error parsing includes in {file_path}: {e}", file=sys.stderr)
+
+
+def _parse_file(content, state, facts, file_path, with_includes=False, cost=None):
+    """Parse a state file for roles and systemd units
+
+    If cost is given, the time spent on YAML, includes and regex extraction and
+    the number of matches of every extractor are recorded in it.
+    """
+    try:
+        # Try to parse as YAML if possible
+        start = time.perf_counter()
+        data, facts['yaml'] = _load_yaml(content)
+        if data and isinstance(data, dict):
+            try:
+                _extract_from_yaml(data, facts)
+            except Exception:
+                # The regex patterns below still apply
+                pass
+        yaml_done = time.perf_counter()
+
+        # Pre-process content to standardize templated variables
+        content = _standardize_templates(content)
+        includes_start = time.perf_counter()
+        if with_includes:
+            _parse_includes(content, state, facts, file_path)
+        includes_done = time.perf_counter()
+
+        matches = SCANNER.scan(content)
+        for ext in SCANNER.extractors:
+            values = matches[ext.name]
+            if not values:
+                continue
+            if ext.kind in ('roles', 'role_dependencies'):
+                for value in values:
+                    if value not in facts[ext.kind]:
+                        facts[ext.kind].append(value)
+            else:
+                facts[ext.kind].update(values)
+
+        if cost is not None:
+            cost['yaml'] = yaml_done - start
+            cost['includes'] = includes_done - includes_start
+            cost['regex'] = (includes_start - yaml_done) + (time.perf_counter() - includes_done)
+            cost['matches'] = {name: len(values) for name, values in matches.items() if values}
+
+    except Exception as e:
+        print(f"Error parsing file {file_path}: {e}", file=sys.stderr)
+
+
+def _extract_from_yaml(data, facts):
+    """Extract information from parsed YAML data"""
+    if not isinstance(data, dict):
+        return
+
+    for key, value in data.items():
+        if isinstance(value, dict):
+            # Look for service.running states
+            if 'service.running' in value:
+                name = value.get('service.running', {}).get('name', key)
+                if name:
+                    facts['systemd_units'].add(name)
+
+            # Look for systemd.* states
+            for k in value:
+                if k.startswith('systemd.'):
+                    name = value.get(k, {}).get('name', key)
+                    if name:
+                        facts['systemd_units'].add(name)
+
+            # Recursively process nested dictionaries
+            _extract_from_yaml(value, facts)
+        elif isinstance(value, list):
+            # Process list items
+            for item in value:
+                if isinstance(item, dict):
+                    _extract_from_yaml(item, facts)
+
+
+# Bump when the layout of cache entries changes
+CACHE_VERSION = 1
+
+
+def parser_stamp():
+    """Fingerprint of the extraction code so cached facts are dropped when patterns change"""
+    digest = hashlib.sha1(f"{CACHE_VERSION}".encode())
+
+    def add_code(code):
+        digest.update(code.co_code)
+        for const in code.co_consts:
+            if hasattr(const, 'co_code'):
+                add_code(const)
+            else:
+                digest.update(repr(const).encode())
+
+    for ext in SCANNER.extractors:
+        digest.update(f"{ext.name}|{ext.kind}|{ext.trigger}|{ext.regex.pattern}".encode())
+    for func in (parse_content, _standardize_templates, _parse_includes, _parse_file, _extract_from_yaml,
+                 Scanner.scan, _locate_service_id, _locate_templated_unit,
+                 _load_yaml, _yaml_has_targets, _jinja_breaks_yaml):
+        add_code(func.__code__)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """On-disk cache of per-file facts keyed by path, mtime, size and content hash"""
+
+    FILENAME = 'parse-cache.json'
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, self.FILENAME)
+        self.stamp = parser_stamp()
+        self.entries = {}
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        """Load cached entries, discarding them if they were written by another parser version"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('stamp') == self.stamp:
+            self.entries = data.get('entries', {})
+
+    @staticmethod
+    def _key(job):
+        state, file_path, is_init = job
+        return f"{state}|{os.path.abspath(file_path)}|{int(is_init)}"
+
+    def lookup(self, job):
+        """Look up the facts of a parse job
+
+        Returns:
+            Tuple of (facts or None on a miss, file signature to pass to store())
+        """
+        key = self._key(job)
+        self.seen.add(key)
+        try:
+            st = os.stat(job[1])
+        except OSError:
+            self.misses += 1
+            return None, None
+        signature = (st.st_mtime_ns, st.st_size)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            if (entry['mtime_ns'], entry['size']) == signature:
+                self.hits += 1
+                return entry['facts'], signature
+            # Touched but possibly unchanged (e.g. a fresh checkout), compare content
+            try:
+                with open(job[1], 'r') as f:
+                    digest = _content_digest(f.read())
+            except Exception:
+                digest = None
+            if digest == entry['sha1']:
+                entry['mtime_ns'], entry['size'] = signature
+                self.hits += 1
+                return entry['facts'], signature
+
+        self.misses += 1
+        return None, signature
+
+    def store(self, job, signature, digest, facts):
+        """Record the facts of a freshly parsed file"""
+        if signature is None or digest is None:
+            return
+        self.entries[self._key(job)] = {
+            'mtime_ns': signature[0],
+            'size': signature[1],
+            'sha1': digest,
+            'facts': facts,
+        }
+
+    def save(self, prune=True):
+        """Write the cache to disk
+
+        Args:
+            prune: Drop entries for files that were not looked up in this run
+        """
+        entries = self.entries
+        if prune:
+            entries = {key: entry for key, entry in entries.items() if key in self.seen}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'stamp': self.stamp, 'entries': entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error writing parse cache {self.path}: {e}", file=sys.stderr)
+
+
+class GitRevisionReader:
+    """Reads the state files under salt_path at git revisions without a checkout
+
+    Blobs are read through a single long-lived 'git cat-file --batch' process.
+    """
+
+    def __init__(self, salt_path):
+        self.salt_path = salt_path
+        self._process = None
+        self.blobs_read = 0
+
+    def _git(self, *args):
+        result = subprocess.run(['git', '-C', self.salt_path, *args], capture_output=True, check=True)
+        return result.stdout
+
+    def resolve(self, rev):
+        """Resolve a revision to its commit ID
+
+        Raises:
+            ValueError: If salt_path is not in a git repository or rev is not a commit
+        """
+        try:
+            return self._git('rev-parse', '--verify', '--quiet', f"{rev}^{{commit}}").decode().strip()
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            message = getattr(e, 'stderr', None)
+            message = message.decode(errors='replace').strip() if message else f"unknown revision {rev}"
+            raise ValueError(message) from None
+
+    def list_files(self, commit):
+        """List the .sls files under salt_path at a commit
+
+        Returns:
+            List of (path relative to salt_path, blob ID) tuples
+        """
+        files = []
+        # Paths are listed relative to salt_path, NUL separated so they are not quoted
+        for record in self._git('ls-tree', '-r', '-z', commit, '--', '.').split(b'\0'):
+            if not record:
+                continue
+            info, path = record.split(b'\t', 1)
+            mode, kind, blob = info.split()
+            if kind == b'blob' and mode in (b'100644', b'100755') and path.endswith(b'.sls'):
+                files.append((os.fsdecode(path), blob.decode()))
+        return files
+
+    def read_blob(self, blob):
+        """Read the content of a blob"""
+        if self._process is None:
+            self._process = subprocess.Popen(['git', '-C', self.salt_path, 'cat-file', '--batch'],
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._process.stdin.write(f"{blob}\n".encode())
+        self._process.stdin.flush()
+        header = self._process.stdout.readline().split()
+        if len(header) != 3:
+            raise OSError(f"git cat-file could not read blob {blob}")
+        data = self._process.stdout.read(int(header[2]))
+        # Each object is followed by a newline
+        self._process.stdout.read(1)
+        self.blobs_read += 1
+        return data
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+
+
+def _parse_blob(job):
+    """Parse the content of a state file read from git
+
+    Args:
+        job: Tuple of (state, display path, is_init, content bytes)
+
+    Returns:
+        Facts of the file
+    """
+    state, file_path, is_init, data = job
+    try:
+        content = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        print(f"Error parsing file {file_path}: {e}", file=sys.stderr)
+        return _finalize_facts(_new_facts())
+    return parse_content(content, state, is_init, file_path)
+
+
+def _walk_dirs(root):
+    """Yield root and all of its non-hidden subdirectories"""
+    pending = [root]
+    while pending:
+        dir_path = pending.pop()
+        yield dir_path
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+                        pending.append(entry.path)
+        except OSError:
+            continue
+
+
+class InotifyWatcher:
+    """Recursive inotify watch on a salt tree (Linux only)"""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+                  IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, root):
+        import ctypes
+        import ctypes.util
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        self.root = root
+        self.dirs = {}
+        self._add_tree(root)
+
+    def _add_tree(self, root):
+        for dir_path in _walk_dirs(root):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.WATCH_MASK)
+            if wd >= 0:
+                self.dirs[wd] = dir_path
+
+    def _read_events(self):
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            yield wd, mask, name
+
+    def poll(self, timeout, settle=0.05):
+        """Wait for changes
+
+        Args:
+            timeout: Seconds to wait for the first event
+            settle: Seconds to keep collecting events after the first one
+
+        Returns:
+            Tuple of (touched .sls paths or None if everything may have changed,
+            whether files or directories were added or removed), or None on timeout
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return None
+        touched = set()
+        structural = False
+        while ready:
+            for wd, mask, name in self._read_events():
+                if mask & self.IN_Q_OVERFLOW:
+                    touched = None
+                    structural = True
+                    continue
+                if mask & self.IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                    continue
+                dir_path = self.dirs.get(wd)
+                if dir_path is None:
+                    continue
+                path = os.path.join(dir_path, name) if name else dir_path
+                if mask & self.IN_ISDIR or mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    structural = True
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO) and not name.startswith('.'):
+                        self._add_tree(path)
+                    continue
+                if not name.endswith('.sls'):
+                    continue
+                if mask & (self.IN_CREATE | self.IN_DELETE | self.IN_MOVED_FROM | self.IN_MOVED_TO):
+                    structural = True
+                if touched is not None:
+                    touched.add(path)
+            # Editors write a file in several steps, collect them as one change
+            ready, _, _ = select.select([self.fd], [], [], settle)
+        return touched, structural
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watch a salt tree by periodically comparing the mtime and size of its .sls files"""
+
+    def __init__(self, root, interval=1.0):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self):
+        snapshot = {}
+        for dir_path in _walk_dirs(self.root):
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.name.endswith('.sls') and entry.is_file():
+                            st = entry.stat()
+                            snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+        return snapshot
+
+    def poll(self, timeout):
+        """Wait for changes, see InotifyWatcher.poll()"""
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(max(0.0, min(self.interval, deadline - time.monotonic())))
+            snapshot = self._snapshot()
+            if snapshot != self.snapshot:
+                old, self.snapshot = self.snapshot, snapshot
+                touched = {path for path, sig in snapshot.items() if old.get(path) != sig}
+                structural = snapshot.keys() != old.keys()
+                return touched, structural
+            if time.monotonic() >= deadline:
+                return None
+
+    def close(self):
+        pass
+
+
+def create_watcher(root, interval=1.0):
+    """Watch root with inotify, falling back to polling where it is unavailable"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), polling every {interval}s", file=sys.stderr)
+    return PollingWatcher(root, interval)
+
+
+def _cpu_time():
+    """CPU time of this process and of its reaped children (parser pools, dot)"""
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+class Timings:
+    """Wall and CPU time of the phases of a run, per-file parse costs and counters"""
+
+    # Steps of a file parse, recorded as sub-phases of the parse phase
+    PARSE_STEPS = ('read', 'yaml', 'includes', 'regex')
+
+    def __init__(self):
+        self.phases = {}
+        self.files = []
+        self.counters = Counter()
+        # FactStore.memory_footprint() of the parsed tree
+        self.fact_store = None
+
+    @contextmanager
+    def phase(self, name):
+        """Measure the wall and CPU time of a block as a phase"""
+        # Register the phase first so sub-phases recorded inside it are listed after it
+        self.phases.setdefault(name, {'wall': 0.0, 'cpu': None})
+        wall, cpu = time.perf_counter(), _cpu_time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - wall, _cpu_time() - cpu)
+
+    def add_phase(self, name, wall, cpu=None):
+        """Add time to a phase; phases measured more than once are summed"""
+        entry = self.phases.setdefault(name, {'wall': 0.0, 'cpu': None})
+        entry['wall'] += wall
+        if cpu is not None:
+            entry['cpu'] = (entry['cpu'] or 0.0) + cpu
+
+    def add_file(self, file_path, cost):
+        """Record the cost of parsing a single file"""
+        self.files.append((file_path, cost))
+        for step in self.PARSE_STEPS:
+            if step in cost:
+                self.add_phase(f"parse.{step}", cost[step])
+        for name, count in cost.get('matches', {}).items():
+            self.counters[f"matches.{name}"] += count
+
+    def slowest(self, top):
+        """The top most expensive files to parse, as (file_path, cost) tuples"""
+        return sorted(self.files, key=lambda item: item[1]['wall'], reverse=True)[:top]
+
+    def to_dict(self, top=10):
+        """Return the measurements as a JSON serializable dict"""
+        return {
+            'phases': self.phases,
+            'files_parsed': len(self.files),
+            'slowest_files': [dict(cost, file=file_path) for file_path, cost in self.slowest(top)],
+            'counters': dict(sorted(self.counters.items())),
+            'fact_store': self.fact_store,
+        }
+
+    def format(self, top=10):
+        """Return the measurements as human-readable lines"""
+        lines = [f"{'phase':<24} {'wall':>11} {'cpu':>11}"]
+        for name, entry in self.phases.items():
+            cpu = '-' if entry['cpu'] is None else f"{entry['cpu'] * 1000:.1f} ms"
+            # Sub-phases summed over files are indented under their phase
+            label = f"  {name.split('.', 1)[1]}" if '.' in name else name
+            lines.append(f"{label:<24} {entry['wall'] * 1000:>8.1f} ms {cpu:>11}")
+
+        if self.files:
+            lines.append("")
+            lines.append(f"Slowest of {len(self.files)} parsed files:")
+            for file_path, cost in self.slowest(top):
+                steps = ', '.join(f"{step} {cost[step] * 1000:.1f}" for step in self.PARSE_STEPS if step in cost)
+                lines.append(f"  {cost['wall'] * 1000:8.2f} ms  {file_path} ({cost.get('bytes', 0)} bytes; {steps} ms)")
+
+        if self.counters:
+            lines.append("")
+            lines.append("Counters:")
+            for name, count in sorted(self.counters.items()):
+                lines.append(f"  {name:<32} {count:>8}")
+
+        if self.fact_store:
+            footprint = self.fact_store
+            lines.append("")
+            lines.append(f"Fact store: {footprint['symbols']} symbols, {footprint['states']} states, "
+                         f"{footprint['total_bytes'] / 1024:.1f} KiB (symbols {footprint['symbol_bytes'] / 1024:.1f} KiB, "
+                         f"states {footprint['state_bytes'] / 1024:.1f} KiB)")
+        return lines
+
+
+def _append_tree(lines, title, items):
+    """Append a titled, sorted tree of items to lines, if there are any"""
+    if not items:
+        return
+    lines.append(f"  {title}:")
+    items = sorted(items)
+    for item in items[:-1]:
+        lines.append(f"    ├── {item}")
+    lines.append(f"    └── {items[-1]}")
+
+
+# Kinds of facts extracted from state files
+FACT_KINDS = ('roles', 'role_dependencies', 'pillars', 'systemd_units', 'includes')
+
+
+class SymbolTable:
+    """Interns fact strings as small integer IDs shared by all states"""
+
+    __slots__ = ('ids', 'names')
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def intern(self, name):
+        """Return the ID of name, adding it to the table if needed"""
+        symbol = self.ids.get(name)
+        if symbol is None:
+            symbol = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol
+
+    def __len__(self):
+        return len(self.names)
+
+
+class FileFacts:
+    """Facts of a single file, as tuples of symbol IDs per kind"""
+
+    __slots__ = FACT_KINDS
+
+
+class StateFacts:
+    """Facts of a state, as insertion-ordered sets (dicts) of symbol IDs per kind
+
+    The sets are only created for kinds the state has facts of.
+    """
+
+    __slots__ = FACT_KINDS
+
+    def __init__(self):
+        for kind in FACT_KINDS:
+            setattr(self, kind, None)
+
+
+class FactStore:
+    """Compact store of the facts of all states
+
+    Every string is stored once in a shared symbol table and states hold
+    insertion-ordered sets of symbol IDs, so adding a fact is O(1) and
+    summaries can union small integers instead of strings.
+    """
+
+    __slots__ = ('symbols', 'states')
+
+    def __init__(self):
+        self.symbols = SymbolTable()
+        self.states = {}
+
+    def compact(self, facts):
+        """Convert the facts record of a parsed file to a FileFacts record"""
+        intern = self.symbols.intern
+        record = FileFacts()
+        for kind in FACT_KINDS:
+            # dict.fromkeys() drops duplicates and keeps the first occurrence
+            setattr(record, kind, tuple(dict.fromkeys(intern(value) for value in facts[kind])))
+        return record
+
+    def merge_many(self, items):
+        """Merge the FileFacts records of (state, record) pairs, in order"""
+        states = self.states
+        for state, record in items:
+            state_facts = states.get(state)
+            if state_facts is None:
+                state_facts = states[state] = StateFacts()
+            for kind in FACT_KINDS:
+                symbols = getattr(record, kind)
+                if not symbols:
+                    continue
+                existing = getattr(state_facts, kind)
+                if existing is None:
+                    setattr(state_facts, kind, dict.fromkeys(symbols))
+                else:
+                    existing.update(dict.fromkeys(symbols))
+
+    def merge(self, state, record):
+        """Merge the FileFacts record of a single file into a state"""
+        self.merge_many(((state, record),))
+
+    def discard(self, state):
+        """Drop all facts of a state"""
+        self.states.pop(state, None)
+
+    def ids(self, state, kind):
+        """Symbol IDs of one kind of facts of a state, in insertion order"""
+        state_facts = self.states.get(state)
+        if state_facts is None:
+            return ()
+        return getattr(state_facts, kind) or ()
+
+    def names(self, state, kind):
+        """Values of one kind of facts of a state, in insertion order"""
+        names = self.symbols.names
+        return [names[symbol] for symbol in self.ids(state, kind)]
+
+    def view(self, kind):
+        """Read-only mapping of state to the values of one kind of facts"""
+        return FactView(self, kind)
+
+    def memory_footprint(self):
+        """Approximate memory held by the store
+
+        Returns:
+            Dict with the number of symbols and states and their size in bytes
+        """
+        symbols = self.symbols
+        symbol_bytes = (sys.getsizeof(symbols.ids) + sys.getsizeof(symbols.names)
+                        + sum(sys.getsizeof(name) + sys.getsizeof(symbol) for name, symbol in symbols.ids.items()))
+        state_bytes = sys.getsizeof(self.states)
+        for state_facts in self.states.values():
+            state_bytes += sys.getsizeof(state_facts)
+            for kind in FACT_KINDS:
+                values = getattr(state_facts, kind)
+                if values is not None:
+                    state_bytes += sys.getsizeof(values)
+        return {
+            'symbols': len(symbols),
+            'states': len(self.states),
+            'symbol_bytes': symbol_bytes,
+            'state_bytes': state_bytes,
+            'total_bytes': symbol_bytes + state_bytes,
+        }
+
+
+class FactView(Mapping):
+    """Read-only mapping of state to the values of one kind of facts in a FactStore
+
+    Only states with facts of the kind are keys, like the dicts of lists and
+    sets the visualizer used to keep.
+    """
+
+    __slots__ = ('store', 'kind')
+
+    def __init__(self, store, kind):
+        self.store = store
+        self.kind = kind
+
+    def __getitem__(self, state):
+        if not self.store.ids(state, self.kind):
+            raise KeyError(state)
+        return self.store.names(state, self.kind)
+
+    def __iter__(self):
+        kind = self.kind
+        return (state for state, state_facts in self.store.states.items() if getattr(state_facts, kind))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# Number of state cards per rendered page, 0 puts every card on a single page
+DEFAULT_PAGE_SIZE = 0
+# Number of state cards per row of a page
+CARDS_PER_ROW = 3
+
 
 class SaltStateVisualizer:
     def __init__(self, salt_path):
         self.salt_path = salt_path
         self.states = []
-        self.roles = defaultdict(list)
-        self.systemd_units = defaultdict(set)
-        self.includes = defaultdict(set)
+        self.state_index = {}
+        # Set by load_states(), whose index only holds the states read so far
+        self.partial_index = False
+        self.facts = FactStore()
+        # Read-only views of the fact store by kind
+        self.roles = self.facts.view('roles')
+        self.systemd_units = self.facts.view('systemd_units')
+        self.includes = self.facts.view('includes')
         self.dependencies = defaultdict(list)
-        self.role_dependencies = defaultdict(list)
-        self.pillar_dependencies = defaultdict(set)
+        self.role_dependencies = self.facts.view('role_dependencies')
+        self.pillar_dependencies = self.facts.view('pillars')
+        self.yaml_stats = Counter()
+        # FileFacts contributed by each (state, file_path, is_init) parse job, so they can be retracted
+        self.file_facts = {}
 
     def find_whole_states(self):
-        """Find all directories containing init.sls files (whole states)"""
-        try:
-            cmd = f"find {self.salt_path} -name 'init.sls' -printf '%h\n' | xargs -n1 basename"
-            result = subprocess.run(cmd, shell=True, check=True, text=True, capture_output=True)
-            unique_states = {state.strip() for state in result.stdout.split('\n') if state.strip()}
-            self.states = sorted(list(unique_states))  # Convert back to sorted list for consistent ordering
-            return self.states
-        except subprocess.CalledProcessError as e:
-            print(f"Error finding whole states: {e}", file=sys.stderr)
-            return []
-
-    def parse_state_files(self):
-        """Parse all state files to extract roles and systemd units"""
-        for state in self.states:
-            state_dir = os.path.join(self.salt_path, state)
-            
-            # Parse init.sls for includes
-            init_file = os.path.join(state_dir, 'init.sls')
-            if os.path.exists(init_file):
-                self._parse_includes(init_file, state)
-            
-            # Parse all .sls files in the state directory
-            for root, _, files in os.walk(state_dir):
-                for file in files:
-                    if file.endswith('.sls'):
-                        file_path = os.path.join(root, file)
-                        self._parse_file(file_path, state)
-
-    def _parse_includes(self, file_path, state):
-        """Parse include statements from a state file"""
-        try:
-            with open(file_path, 'r') as f:
-                content = f.read()
-                
-            # Pre-process content to standardize templated variables
-            content = re.sub(r'@\{\{\s*([^\}]+)\s*\}\}', r'@<\1>', content)
-            # Make sure to standardize any remaining templated variables
-            content = re.sub(r'\{\{\s*([^\}]+)\s*\}\}', r'<\1>', content)
-                
-            # Find include statements
-            include_match = re.search(r'include:\s*\n((?:\s*-\s*.*\n)+)', content)
-            if include_match:
-                includes_block = include_match.group(1)
-                includes = re.findall(r'-\s*(.*)', includes_block)
-                
-                includes_set = set(include.strip() for include in includes)
-                includes_set = {include if not include.startswith('.') else f"{state}{include}" for include in includes_set}
-                self.includes[state] = self.includes[state].union(includes_set)
-        except Exception as e:
-            print(f"Error parsing includes in {file_path}: {e}", file=sys.stderr)
+        """Find all directories containing init.sls files (whole states)
 
-    def _parse_file(self, file_path, state):
-        """Parse a state file for roles and systemd units"""
-        try:
-            with open(file_path, 'r') as f:
-                content = f.read()
-            
-            # Try to parse as YAML if possible
+        Nested states get dotted IDs (e.g. a/b/init.sls is state a.b), matching
+        how they are referenced from include statements.
+        """
+        self.state_index = self.index_tree()
+        self.partial_index = False
+        self.states = sorted(self.state_index)
+        return self.states
+
+    def index_tree(self):
+        """Index states and their .sls files in a single walk of salt_path
+
+        Each .sls file belongs to the nearest enclosing directory with an init.sls,
+        so files of nested states are not attributed to their parents. Hidden
+        directories (.git, caches) are skipped.
+
+        Returns:
+            Dict mapping state ID to {'dir', 'init', 'files'}
+        """
+        index = {}
+        pending = [(self.salt_path, (), None)]
+        while pending:
+            dir_path, parts, owner = pending.pop()
             try:
-                # Skip the first part if it's a comment block
-                yaml_content = re.sub(r'^#.*?(?=^[^#])', '', content, flags=re.DOTALL | re.MULTILINE)
-                data = yaml.safe_load(yaml_content)
-                if data and isinstance(data, dict):
-                    self._extract_from_yaml(data, state)
-            except Exception:
-                # Fallback to regex parsing if YAML parsing fails
-                pass
-            
-            # Pre-process content to standardize templated variables
-            content = re.sub(r'@\{\{\s*([^\}]+)\s*\}\}', r'@<\1>', content)
-            # Make sure to standardize any remaining templated variables
-            content = re.sub(r'\{\{\s*([^\}]+)\s*\}\}', r'<\1>', content)
-            
-            # Find roles defined in the state
-            role_matches = re.findall(r'role\s*:\s*([^\n]+)', content)
-            for role in role_matches:
-                role = role.strip()
-                if role not in self.roles[state]:
-                    self.roles[state].append(role)
-            
-            # Find role dependencies (roles used in conditional blocks)
-            role_dep_matches = re.findall(r'salt\.pixpillar\.nodehasrole\([\'"]([^\'"]+)[\'"]\)', content)
-            for role in role_dep_matches:
-                role = role.strip()
-                if role not in self.role_dependencies[state]:
-                    self.role_dependencies[state].append(role)
-            
-            # Find pillar dependencies (pillars accessed via salt.pillar.get)
-            pillar_matches = re.findall(r'salt\.pillar\.get\([\'"]([^\'"]+)[\'"]\)', content)
-            for pillar in pillar_matches:
-                pillar = pillar.strip()
-                self.pillar_dependencies[state].add(pillar)
-            
-            # Find systemd units - multiple patterns
-            service_matches = re.findall(r'service\.running:\s*\n\s*-\s*name:\s*([^\n]+)', content)
-            for service in service_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            # Pattern 2: Look for direct service.running declarations nested under other IDs
-            service_nested_matches = re.findall(r'([^:\n]+):\s*\n\s*service\.running', content)
-            for service in service_nested_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            # Pattern 3: Look for systemd.* states with name field
-            systemd_matches = re.findall(r'systemd\.[^:]+:\s*\n\s*-\s*name:\s*([^\n]+)', content)
-            for service in systemd_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            # Pattern 4: Look for service.disabled states
-            disabled_matches = re.findall(r'service\.disabled:\s*\n\s*-\s*name:\s*([^\n]+)', content)
-            for service in disabled_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            # Pattern 5: Look for service names in IDs with service.running
-            service_id_matches = re.findall(r'([^:\n]+):\s*\n\s*service\.running', content)
-            for service in service_id_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            # Pattern 6: Look for enable/disable service statements
-            enable_matches = re.findall(r'systemctl\s+enable\s+([^\s&;]+)', content)
-            for service in enable_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            disable_matches = re.findall(r'systemctl\s+disable\s+([^\s&;]+)', content)
-            for service in disable_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            # Pattern 7: Look for specific timer patterns
-            timer_matches = re.findall(r'(ap-analytics@\*\.timer)', content)
-            for service in timer_matches:
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-            # Pattern 8: Look for templated service names
-            templated_service_matches = re.findall(r'([\w@\.-]+@<[^>]+>\.(timer|service))', content)
-            for service_match in templated_service_matches:
-                if isinstance(service_match, tuple):
-                    service = service_match[0]
-                else:
-                    service = service_match
-                service = service.strip()
-                self.systemd_units[state].add(service)
-            
-        except Exception as e:
-            print(f"Error parsing file {file_path}: {e}", file=sys.stderr)
+                with os.scandir(dir_path) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"Error reading directory {dir_path}: {e}", file=sys.stderr)
+                continue
 
-    def _extract_from_yaml(self, data, state):
-        """Extract information from parsed YAML data"""
-        if not isinstance(data, dict):
-            return
-        
-        for key, value in data.items():
-            if isinstance(value, dict):
-                # Look for service.running states
-                if 'service.running' in value:
-                    name = value.get('service.running', {}).get('name', key)
-                    if name:
-                        self.systemd_units[state].add(name)
-                
-                # Look for systemd.* states
-                for k in value:
-                    if k.startswith('systemd.'):
-                        name = value.get(k, {}).get('name', key)
-                        if name:
-                            self.systemd_units[state].add(name)
-                
-                # Recursively process nested dictionaries
-                self._extract_from_yaml(value, state)
-            elif isinstance(value, list):
-                # Process list items
-                for item in value:
-                    if isinstance(item, dict):
-                        self._extract_from_yaml(item, state)
+            # A directory with an init.sls is a state of its own
+            if parts and any(entry.name == 'init.sls' and entry.is_file() for entry in entries):
+                owner = '.'.join(parts)
+                index[owner] = {
+                    'dir': dir_path,
+                    'init': os.path.join(dir_path, 'init.sls'),
+                    'files': [],
+                }
+
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        subdirs.append(entry)
+                elif owner is not None and entry.name.endswith('.sls') and entry.is_file():
+                    index[owner]['files'].append(entry.path)
+
+            # Push in reverse so subdirectories are visited in name order
+            for entry in reversed(subdirs):
+                pending.append((entry.path, parts + (entry.name,), owner))
+        return index
+
+    def index_state(self, state):
+        """Index a single state without walking the rest of salt_path
+
+        Returns:
+            {'dir', 'init', 'files'} as in index_tree(), or None if state has no
+            init.sls (or lies in a hidden directory)
+        """
+        parts = state.split('.')
+        if not all(parts) or any(part.startswith('.') for part in parts):
+            return None
+        dir_path = os.path.join(self.salt_path, *parts)
+        init_path = os.path.join(dir_path, 'init.sls')
+        if not os.path.isfile(init_path):
+            return None
+
+        files = []
+        pending = [dir_path]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"Error reading directory {current}: {e}", file=sys.stderr)
+                continue
+            # Subdirectories with an init.sls are states of their own
+            if current != dir_path and any(entry.name == 'init.sls' and entry.is_file() for entry in entries):
+                continue
+
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        subdirs.append(entry)
+                elif entry.name.endswith('.sls') and entry.is_file():
+                    files.append(entry.path)
+            # Push in reverse so subdirectories are visited in name order
+            for entry in reversed(subdirs):
+                pending.append(entry.path)
+        return {'dir': dir_path, 'init': init_path, 'files': files}
+
+    def resolve_state(self, name):
+        """Find the state an include (or state name) refers to
+
+        An include names either a state directory (a.b -> a/b/init.sls) or a file
+        (a.b -> a/b.sls), which belongs to the nearest enclosing state.
+
+        Only a partial index (see load_states()) falls back to indexing states
+        from the disk, so a tree read from a git revision never sees the
+        working tree.
+
+        Returns:
+            Tuple of (state, index entry), or (None, None) if nothing matches
+        """
+        def lookup(state):
+            info = self.state_index.get(state)
+            if info is None and self.partial_index:
+                info = self.index_state(state)
+            return info
+
+        info = lookup(name)
+        if info is not None:
+            return name, info
+        parts = name.split('.')
+        if not all(parts):
+            return None, None
+        file_path = os.path.join(self.salt_path, *parts) + '.sls'
+        for length in range(len(parts) - 1, 0, -1):
+            state = '.'.join(parts[:length])
+            info = lookup(state)
+            if info is not None:
+                return (state, info) if file_path in info['files'] else (None, None)
+        return None, None
+
+    def load_states(self, names, depth=None, jobs=1, cache=None, timings=None):
+        """Index and parse only some states and, lazily, the states they include
+
+        The requested states are parsed first, then the states named by their
+        include statements, level by level, until depth levels of includes have
+        been followed (all of them if depth is None). Nothing else under
+        salt_path is read.
+
+        Returns:
+            Tuple of (requested names that are not states, includes that could not be resolved)
+        """
+        self.partial_index = True
+        missing = []
+        unresolved = set()
+        frontier = []
+        for name in names:
+            state, info = self.resolve_state(name.replace('/', '.'))
+            if state is None:
+                missing.append(name)
+            elif state not in self.state_index:
+                self.state_index[state] = info
+                frontier.append(state)
+
+        level = 0
+        while frontier:
+            self.states = sorted(self.state_index)
+            self.parse_state_files(jobs=jobs, cache=cache, timings=timings, states=frontier)
+            level += 1
+            if depth is not None and level > depth:
+                break
+            next_frontier = []
+            for state in frontier:
+                for include in sorted(self.includes.get(state, ())):
+                    included, info = self.resolve_state(include)
+                    if included is None:
+                        unresolved.add(include)
+                    elif included not in self.state_index:
+                        self.state_index[included] = info
+                        next_frontier.append(included)
+            frontier = next_frontier
+        self.states = sorted(self.state_index)
+        return missing, sorted(unresolved)
+
+    def index_paths(self, paths):
+        """Index states from the paths of the .sls files under salt_path
+
+        Gives the same result as index_tree() for a tree containing these files.
+
+        Args:
+            paths: Paths of .sls files relative to salt_path, '/' separated
+
+        Returns:
+            Dict mapping state ID to {'dir', 'init', 'files'}
+        """
+        paths = [path for path in paths if not any(part.startswith('.') for part in path.split('/')[:-1])]
+        state_dirs = {path[:-len('/init.sls')] for path in paths if path.endswith('/init.sls')}
+
+        def walk_order(path):
+            # index_tree lists the files of a directory before those of its subdirectories
+            parts = path.split('/')
+            return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+        index = {}
+        for state_dir in sorted(state_dirs, key=lambda state_dir: walk_order(state_dir + '/init.sls')):
+            dir_path = os.path.join(self.salt_path, *state_dir.split('/'))
+            index[state_dir.replace('/', '.')] = {
+                'dir': dir_path,
+                'init': os.path.join(dir_path, 'init.sls'),
+                'files': [],
+            }
+        for path in sorted(paths, key=walk_order):
+            # Each file belongs to the nearest enclosing state directory
+            parts = path.split('/')[:-1]
+            while parts and '/'.join(parts) not in state_dirs:
+                parts.pop()
+            if parts:
+                index['.'.join(parts)]['files'].append(os.path.join(self.salt_path, *path.split('/')))
+        return index
+
+    def load_revision(self, reader, rev, jobs=1, blob_facts=None):
+        """Index and parse the states of a git revision instead of the working tree
+
+        Args:
+            reader: GitRevisionReader for salt_path
+            rev: Revision to read
+            jobs: Number of worker processes to parse files with (1 parses serially)
+            blob_facts: Optional dict of facts by (blob ID, state, is_init), shared
+                between revisions so unchanged blobs are only parsed once
+
+        Returns:
+            Number of files that were parsed
+        """
+        blob_facts = {} if blob_facts is None else blob_facts
+        commit = reader.resolve(rev)
+        files = reader.list_files(commit)
+        blobs = {os.path.join(self.salt_path, *path.split('/')): blob for path, blob in files}
+        self.state_index = self.index_paths([path for path, _ in files])
+        self.partial_index = False
+        self.states = sorted(self.state_index)
+
+        parse_jobs = self._collect_parse_jobs()
+        keys = [(blobs[file_path], state, is_init) for state, file_path, is_init in parse_jobs]
+        pending = {}
+        for job, key in zip(parse_jobs, keys):
+            if key not in blob_facts and key not in pending:
+                pending[key] = job + (reader.read_blob(key[0]),)
+
+        if jobs > 1 and len(pending) > 1:
+            chunksize = max(1, len(pending) // (jobs * 4))
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                parsed = list(executor.map(_parse_blob, pending.values(), chunksize=chunksize))
+        else:
+            parsed = [_parse_blob(job) for job in pending.values()]
+        for key, facts in zip(pending, parsed):
+            blob_facts[key] = facts
+            if facts['yaml']:
+                self.yaml_stats[facts['yaml']] += 1
+
+        self._store_file_facts(zip(parse_jobs, (blob_facts[key] for key in keys)))
+        return len(pending)
+
+    def parse_state_files(self, jobs=1, cache=None, timings=None, states=None):
+        """Parse all state files to extract roles and systemd units
+
+        Args:
+            jobs: Number of worker processes to parse files with (1 parses serially)
+            cache: Optional ParseCache; only files missing from it are parsed
+            timings: Optional Timings to record the cost of every parsed file in
+            states: Only parse the files of these states
+        """
+        parse_jobs = self._collect_parse_jobs(states)
+        results = [None] * len(parse_jobs)
+        signatures = {}
+
+        pending = []
+        for idx, job in enumerate(parse_jobs):
+            if cache is not None:
+                results[idx], signatures[idx] = cache.lookup(job)
+            if results[idx] is None:
+                pending.append(idx)
+
+        pending_jobs = [parse_jobs[idx] for idx in pending]
+        parse = _parse_job if timings is None else _timed_parse_job
+        if jobs > 1 and len(pending_jobs) > 1:
+            chunksize = max(1, len(pending_jobs) // (jobs * 4))
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                parsed = list(executor.map(parse, pending_jobs, chunksize=chunksize))
+        else:
+            parsed = [parse(job) for job in pending_jobs]
+
+        if timings is not None:
+            timings.counters['files.cached'] += len(parse_jobs) - len(pending)
+            timings.counters['files.parsed'] += len(pending)
+            for idx, (_, _, cost) in zip(pending, parsed):
+                timings.add_file(parse_jobs[idx][1], cost)
+
+        for idx, (digest, facts, *_) in zip(pending, parsed):
+            results[idx] = facts
+            if facts['yaml']:
+                self.yaml_stats[facts['yaml']] += 1
+            if cache is not None:
+                cache.store(parse_jobs[idx], signatures[idx], digest, facts)
+
+        # Merge in job order so the result does not depend on worker scheduling
+        self._store_file_facts(zip(parse_jobs, results))
+
+    def _store_file_facts(self, parsed):
+        """Record the facts of (job, facts) pairs of parsed files and merge them into their states"""
+        compact = self.facts.compact
+        records = [(job, compact(facts)) for job, facts in parsed]
+        self.file_facts.update(records)
+        self.facts.merge_many((job[0], record) for job, record in records)
+
+    def apply_changes(self, touched=None, reindex=True):
+        """Bring the parsed facts up to date after files changed on disk
+
+        Facts of files that disappeared (or moved to another state) are retracted
+        and only new or touched files are parsed again; the affected states are
+        rebuilt from the facts of their remaining files.
+
+        Args:
+            touched: Paths of .sls files whose content changed, None to re-parse all files
+            reindex: Walk the tree again because files or directories were added or removed
+
+        Returns:
+            Set of states whose facts were rebuilt
+        """
+        if reindex:
+            self.find_whole_states()
+        parse_jobs = self._collect_parse_jobs()
+        current = set(parse_jobs)
+
+        dirty_states = set()
+        for job in [job for job in self.file_facts if job not in current]:
+            del self.file_facts[job]
+            dirty_states.add(job[0])
+
+        for job in parse_jobs:
+            if job in self.file_facts and touched is not None and job[1] not in touched:
+                continue
+            _, facts = _parse_job(job)
+            self.file_facts[job] = self.facts.compact(facts)
+            dirty_states.add(job[0])
+
+        self._rebuild_states(dirty_states)
+        return dirty_states
+
+    def _rebuild_states(self, states):
+        """Recompute the facts of states from the facts of their files"""
+        merged = []
+        for state in states:
+            self.facts.discard(state)
+            info = self.state_index.get(state)
+            if info is None:
+                continue
+            for file_path in info['files']:
+                record = self.file_facts.get((state, file_path, file_path == info['init']))
+                if record is not None:
+                    merged.append((state, record))
+        self.facts.merge_many(merged)
+
+    def _collect_parse_jobs(self, states=None):
+        """List the (state, file_path, is_init) parse jobs for all states, or the given ones"""
+        parse_jobs = []
+        for state in self.states if states is None else states:
+            info = self.state_index.get(state)
+            if info is None:
+                continue
+            # Parse all .sls files of the state, init.sls also for includes
+            for file_path in info['files']:
+                parse_jobs.append((state, file_path, file_path == info['init']))
+        return parse_jobs
 
     def generate_ascii_diagram(self, show_pillars=True, show_roles=True):
         """Generate ASCII diagram of states, roles, and systemd units"""
-        diagram = []
-        diagram.append("=" * 80)
-        diagram.append("SaltStack State Visualization")
-        diagram.append("=" * 80)
-        diagram.append("")
-        
+        return "\n".join(self.iter_ascii_diagram(show_pillars=show_pillars, show_roles=show_roles))
+
+    def iter_ascii_diagram(self, show_pillars=True, show_roles=True):
+        """Generate the lines of the ASCII diagram, one state section at a time
+
+        The summary counts are accumulated while the states are emitted, so the
+        diagram can be streamed to its destination as it is produced.
+        """
+        yield "=" * 80
+        yield "SaltStack State Visualization"
+        yield "=" * 80
+        yield ""
+
+        all_roles = set()
+        all_role_deps = set()
+        all_pillar_deps = set()
+        all_systemd_units = set()
+
+        # Totals are counted over symbol IDs rather than strings
+        store = self.facts
+        names = store.symbols.names
+
         # Generate diagram for each state
         for state in sorted(self.states):
-            diagram.append(f"State: {state}")
-            diagram.append("-" * 40)
-            
+            roles = store.ids(state, 'roles')
+            role_deps = store.ids(state, 'role_dependencies')
+            pillar_deps = store.ids(state, 'pillars')
+            units = store.ids(state, 'systemd_units')
+            all_roles.update(roles)
+            all_role_deps.update(role_deps)
+            all_pillar_deps.update(pillar_deps)
+            all_systemd_units.update(units)
+
+            section = [f"State: {state}", "-" * 40]
             # Add roles
-            if state in self.roles and self.roles[state]:
-                diagram.append("  Roles:")
-                roles = sorted(self.roles[state])
-                for i, role in enumerate(roles):
-                    if i == len(roles) - 1:
-                        diagram.append(f"    └── {role}")
-                    else:
-                        diagram.append(f"    ├── {role}")
-            
-            # Add role dependencies if enabled
-            if show_roles and state in self.role_dependencies and self.role_dependencies[state]:
-                # Filter out roles that are already in the roles list to avoid duplicates
-                role_deps = [r for r in self.role_dependencies[state] if r not in self.roles.get(state, [])]
-                if role_deps:
-                    diagram.append("  Role Dependencies:")
-                    role_deps = sorted(role_deps)
-                    for i, role in enumerate(role_deps):
-                        if i == len(role_deps) - 1:
-                            diagram.append(f"    └── {role}")
-                        else:
-                            diagram.append(f"    ├── {role}")
-            
+            _append_tree(section, "Roles", [names[symbol] for symbol in roles])
+            # Add role dependencies if enabled, without the roles that are already listed
+            if show_roles:
+                _append_tree(section, "Role Dependencies", [names[symbol] for symbol in role_deps if symbol not in roles])
             # Add pillar dependencies if enabled
-            if show_pillars and state in self.pillar_dependencies and self.pillar_dependencies[state]:
-                diagram.append("  Pillar Dependencies:")
-                pillar_deps = sorted(list(self.pillar_dependencies[state]))
-                for i, pillar in enumerate(pillar_deps):
-                    if i == len(pillar_deps) - 1:
-                        diagram.append(f"    └── {pillar}")
-                    else:
-                        diagram.append(f"    ├── {pillar}")
-            
+            if show_pillars:
+                _append_tree(section, "Pillar Dependencies", [names[symbol] for symbol in pillar_deps])
             # Add systemd units
-            if state in self.systemd_units and self.systemd_units[state]:
-                diagram.append("  Systemd Units:")
-                units = sorted(list(self.systemd_units[state]))
-                for i, unit in enumerate(units):
-                    if i == len(units) - 1:
-                        diagram.append(f"    └── {unit}")
-                    else:
-                        diagram.append(f"    ├── {unit}")
-            
+            _append_tree(section, "Systemd Units", [names[symbol] for symbol in units])
             # Add dependencies (includes)
-            if state in self.includes and self.includes[state]:
-                diagram.append("  Dependencies:")
-                includes = sorted(list(self.includes[state]))
-                for i, include in enumerate(includes):
-                    if i == len(includes) - 1:
-                        diagram.append(f"    └── {include}")
-                    else:
-                        diagram.append(f"    ├── {include}")
-            
-            diagram.append("")
-        
+            _append_tree(section, "Dependencies", store.names(state, 'includes'))
+            section.append("")
+            yield from section
+
         # Add summary statistics
-        # Count unique roles
-        all_roles = set()
-        for roles in self.roles.values():
-            all_roles.update(roles)
-        
-        # Count unique role dependencies
-        all_role_deps = set()
-        for deps in self.role_dependencies.values():
-            all_role_deps.update(deps)
-        
-        # Count unique pillar dependencies
-        all_pillar_deps = set()
-        for deps in self.pillar_dependencies.values():
-            all_pillar_deps.update(deps)
-        
-        # Count unique systemd units
-        all_systemd_units = set()
-        for units in self.systemd_units.values():
-            all_systemd_units.update(units)
-        
-        diagram.append("=" * 80)
-        diagram.append(f"Total States: {len(self.states)}")
-        diagram.append(f"Total Roles: {len(all_roles)}")
+        yield "=" * 80
+        yield f"Total States: {len(self.states)}"
+        yield f"Total Roles: {len(all_roles)}"
+        if show_roles:
+            yield f"Total Role Dependencies: {len(all_role_deps)}"
+        if show_pillars:
+            yield f"Total Pillar Dependencies: {len(all_pillar_deps)}"
+        yield f"Total Systemd Units: {len(all_systemd_units)}"
+        yield "=" * 80
+
+    def iter_state_records(self, show_pillars=True, show_roles=True, show_systemd=True):
+        """Generate one record of facts per state, sorted by state
+
+        Every list in a record is sorted so the export is stable across runs.
+        Facts that are switched off are left out of the records.
+        """
+        for state in sorted(self.states):
+            record = {
+                'state': state,
+                'roles': sorted(self.roles.get(state, ())),
+            }
+            if show_roles:
+                record['role_dependencies'] = sorted(self.role_dependencies.get(state, ()))
+            if show_pillars:
+                record['pillars'] = sorted(self.pillar_dependencies.get(state, ()))
+            if show_systemd:
+                record['systemd_units'] = sorted(self.systemd_units.get(state, ()))
+            record['includes'] = sorted(self.includes.get(state, ()))
+            yield record
+
+    def iter_json(self, show_pillars=True, show_roles=True, show_systemd=True, ndjson=False):
+        """Generate the JSON export in chunks, one state record at a time
+
+        Args:
+            ndjson: Emit one JSON object per state and line instead of a single
+                document with the states and summary counts
+
+        Yields:
+            Lines of the export (without newlines)
+        """
+        records = self.iter_state_records(show_pillars=show_pillars, show_roles=show_roles,
+                                          show_systemd=show_systemd)
+        if ndjson:
+            for record in records:
+                yield json.dumps(record, sort_keys=True)
+            return
+
+        # Summary counts are accumulated while the records are emitted
+        totals = {'roles': set()}
         if show_roles:
-            diagram.append(f"Total Role Dependencies: {len(all_role_deps)}")
+            totals['role_dependencies'] = set()
         if show_pillars:
-            diagram.append(f"Total Pillar Dependencies: {len(all_pillar_deps)}")
-        diagram.append(f"Total Systemd Units: {len(all_systemd_units)}")
-        diagram.append("=" * 80)
-        
-        return "\n".join(diagram)
+            totals['pillars'] = set()
+        if show_systemd:
+            totals['systemd_units'] = set()
+        yield '{"states": ['
+        separator = ''
+        for record in records:
+            for key, values in totals.items():
+                values.update(record[key])
+            yield f"{separator}{json.dumps(record, sort_keys=True)}"
+            separator = ','
+        summary = {'states': len(self.states)}
+        summary.update((key, len(values)) for key, values in totals.items())
+        yield f'], "summary": {json.dumps(summary, sort_keys=True)}}}'
 
-    def generate_graphviz(self, output_file=None, show_pillars=True, show_roles=True, show_systemd=True, format='svg'):
+    def generate_graphviz(self, output_file=None, show_pillars=True, show_roles=True, show_systemd=True, format='svg',
+                          page_size=DEFAULT_PAGE_SIZE, jobs=1, cache=None, timings=None):
         """Generate a graphical visualization using graphviz with a card-based layout
 
+        The cards are split into pages of page_size states which are laid out by
+        separate dot runs, in parallel when jobs > 1. Rendered pages are looked up
+        in the cache by a hash of their dot source, so only pages whose content
+        changed are laid out again. A single page is written to output_file
+        directly; several pages are written next to an HTML index linking them.
+
         Args:
             output_file: Path to save the output file (without extension)
             show_pillars: Whether to show pillar dependencies
             show_roles: Whether to show role dependencies
             show_systemd: Whether to show systemd units
             format: Output format (svg, png, pdf, etc.)
+            page_size: Number of state cards per page (1 renders one card per state, 0 puts every card
+                on a single page written to output_file)
+            jobs: Number of dot processes to run concurrently
+            cache: Optional RenderCache of previously rendered pages
+            timings: Optional Timings to record the time spent in dot in
 
         Returns:
-            Path to the generated file
+            Path to the generated file, or to the HTML index for several pages
         """
-        # Create a new graph with HTML-like labels for better formatting
-        dot = graphviz.Digraph(
-            comment='SaltStack State Visualization',
-            format=format,
-            engine='dot',
-            node_attr={
-                'shape': 'plaintext',  # Use plaintext for HTML-like labels
-                'fontname': 'Arial',
-                'margin': '0',
-            },
-            graph_attr={
-                'rankdir': 'TB',       # Top to bottom layout
-                'ranksep': '0.75',     # Separation between ranks
-                'nodesep': '0.5',      # Separation between nodes
-                'splines': 'ortho',    # Use orthogonal lines
-                'concentrate': 'true',  # Concentrate edges
-                'ratio': 'fill',       # Fill the available space
-                'compound': 'true',     # Allow edges between clusters
-                'newrank': 'true',     # Better ranking
-            }
-        )
-        
-        def sanitize_id(text):
-            """Sanitize text to be used as a node ID"""
-            # Replace characters that could cause issues in DOT syntax
-            return re.sub(r'[^a-zA-Z0-9_]', '_', text)
-        
-        def sanitize_html(text):
-            """Sanitize text to be used in HTML-like labels"""
-            # Escape HTML special characters
-            return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-        
-        # Define colors
-        state_color = '#ADD8E6'  # Light blue
-        role_color = '#90EE90'   # Light green
-        pillar_color = '#FFFFE0' # Light yellow
-        systemd_color = '#FFB6C1' # Light red
-        
         # Filter out states with no roles, role dependencies, pillars, or systemd units
         filtered_states = []
         for state in sorted(self.states):
@@ -368,92 +1580,415 @@ class SaltStateVisualizer:
             has_role_deps = show_roles and state in self.role_dependencies and self.role_dependencies[state]
             has_pillars = show_pillars and state in self.pillar_dependencies and self.pillar_dependencies[state]
             has_systemd = show_systemd and state in self.systemd_units and self.systemd_units[state]
-            
+
             if has_roles or has_role_deps or has_pillars or has_systemd:
                 filtered_states.append(state)
-        
-        # Create a grid layout with states in a 3-column grid
-        states_per_row = 3
-        
-        # Use a completely different approach with HTML-like tables for layout
-        dot = graphviz.Digraph(
-            comment='SaltStack State Visualization',
-            format=format,
-            engine='dot',
-            node_attr={
-                'shape': 'plaintext',
-                'fontname': 'Arial',
-            },
-            graph_attr={
-                'rankdir': 'TB',
-                'ranksep': '0.5',
-                'nodesep': '0.5',
-            }
-        )
-        
-        # Create a main table for the entire layout
-        main_label = '<'
-        main_label += '<TABLE BORDER="0" CELLBORDER="0" CELLSPACING="10" CELLPADDING="10">'
-        
-        # Calculate how many rows we need
-        rows_needed = (len(filtered_states) + states_per_row - 1) // states_per_row
-        
-        # Generate the table rows
-        for row in range(rows_needed):
-            main_label += '<TR>'
-            
-            # Add cells for this row
-            for col in range(states_per_row):
-                idx = row * states_per_row + col
-                if idx < len(filtered_states):
-                    state = filtered_states[idx]
-                    
-                    # Create a nested table for each state card
-                    main_label += '<TD>'
-                    main_label += f'<TABLE BORDER="1" CELLBORDER="1" CELLSPACING="0" CELLPADDING="4" BGCOLOR="white">'
-                    
-                    # State header
-                    main_label += f'<TR><TD BGCOLOR="{state_color}" COLSPAN="2"><B>{sanitize_html(state)}</B></TD></TR>'
-                    
-                    # Role dependencies section - only show this section, not regular roles
-                    if show_roles and state in self.role_dependencies and self.role_dependencies[state]:
-                        main_label += f'<TR><TD BGCOLOR="{role_color}" COLSPAN="2"><B>Role Dependencies</B></TD></TR>'
-                        for role in sorted(self.role_dependencies[state]):
-                            main_label += f'<TR><TD COLSPAN="2" ALIGN="LEFT">{sanitize_html(role)}</TD></TR>'
-                    
-                    # Pillar dependencies section
-                    if show_pillars and state in self.pillar_dependencies and self.pillar_dependencies[state]:
-                        main_label += f'<TR><TD BGCOLOR="{pillar_color}" COLSPAN="2"><B>Pillar Dependencies</B></TD></TR>'
-                        for pillar in sorted(list(self.pillar_dependencies[state])):
-                            main_label += f'<TR><TD COLSPAN="2" ALIGN="LEFT">{sanitize_html(pillar)}</TD></TR>'
-                    
-                    # Systemd units section
-                    if show_systemd and state in self.systemd_units and self.systemd_units[state]:
-                        main_label += f'<TR><TD BGCOLOR="{systemd_color}" COLSPAN="2"><B>Systemd Units</B></TD></TR>'
-                        for unit in sorted(list(self.systemd_units[state])):
-                            main_label += f'<TR><TD COLSPAN="2" ALIGN="LEFT">{sanitize_html(unit)}</TD></TR>'
-                        
-                    # Close the card table
-                    main_label += '</TABLE>'
-                    main_label += '</TD>'
-                else:
-                    # Empty cell for padding
-                    main_label += '<TD></TD>'
-            
-            main_label += '</TR>'
-        
-        # Close the main table
-        main_label += '</TABLE>'
-        main_label += '>'
-        
-        # Create a single node with the entire HTML table
-        dot.node('salt_states', label=main_label, shape='plaintext')
-        
-        # Render the graph
-        if output_file:
-            return dot.render(output_file, cleanup=True, format=format)
+
+        page_size = page_size if page_size and page_size > 0 else max(1, len(filtered_states))
+        pages = [filtered_states[idx:idx + page_size] for idx in range(0, len(filtered_states), page_size)] or [[]]
+        sources = [
+            _page_source([self._state_card(state, show_pillars, show_roles, show_systemd) for state in page])
+            for page in pages
+        ]
+
+        # Only lay out the pages that are not cached yet
+        rendered = [None] * len(sources)
+        keys = [RenderCache.key(source, format) for source in sources]
+        missing = []
+        for idx, key in enumerate(keys):
+            rendered[idx] = cache.get(key) if cache is not None else None
+            if rendered[idx] is None:
+                missing.append(idx)
+
+        render_jobs = [(sources[idx], format) for idx in missing]
+        start, cpu = time.perf_counter(), _cpu_time()
+        if jobs > 1 and len(render_jobs) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(jobs, len(render_jobs))) as executor:
+                results = list(executor.map(_render_page, render_jobs))
         else:
-            return dot.render(cleanup=True, format=format)
+            results = [_render_page(job) for job in render_jobs]
+        if timings is not None:
+            timings.add_phase('render.dot', time.perf_counter() - start, _cpu_time() - cpu)
+            timings.counters['render.pages'] += len(sources)
+            timings.counters['render.dot_runs'] += len(render_jobs)
+        for idx, data in zip(missing, results):
+            rendered[idx] = data
+            if cache is not None:
+                cache.put(keys[idx], data)
+
+        # graphviz's default file name, used when rendering without an output file
+        base = output_file or 'Digraph.gv'
+        if len(rendered) == 1:
+            output_path = f"{base}.{format}"
+            _write_atomic(output_path, rendered[0])
+            return output_path
+        return _write_page_index(base, format, pages, rendered)
+
+    def _state_card(self, state, show_pillars, show_roles, show_systemd):
+        """Build the HTML-like label of a single state card"""
+        # Define colors
+        state_color = '#ADD8E6'  # Light blue
+        role_color = '#90EE90'   # Light green
+        pillar_color = '#FFFFE0' # Light yellow
+        systemd_color = '#FFB6C1' # Light red
+
+        # Create a nested table for each state card
+        card = ['<TABLE BORDER="1" CELLBORDER="1" CELLSPACING="0" CELLPADDING="4" BGCOLOR="white">']
+
+        # State header
+        card.append(f'<TR><TD BGCOLOR="{state_color}" COLSPAN="2"><B>{_sanitize_html(state)}</B></TD></TR>')
+
+        # Role dependencies section - only show this section, not regular roles
+        if show_roles and state in self.role_dependencies and self.role_dependencies[state]:
+            card.append(f'<TR><TD BGCOLOR="{role_color}" COLSPAN="2"><B>Role Dependencies</B></TD></TR>')
+            for role in sorted(self.role_dependencies[state]):
+                card.append(f'<TR><TD COLSPAN="2" ALIGN="LEFT">{_sanitize_html(role)}</TD></TR>')
+
+        # Pillar dependencies section
+        if show_pillars and state in self.pillar_dependencies and self.pillar_dependencies[state]:
+            card.append(f'<TR><TD BGCOLOR="{pillar_color}" COLSPAN="2"><B>Pillar Dependencies</B></TD></TR>')
+            for pillar in sorted(self.pillar_dependencies[state]):
+                card.append(f'<TR><TD COLSPAN="2" ALIGN="LEFT">{_sanitize_html(pillar)}</TD></TR>')
+
+        # Systemd units section
+        if show_systemd and state in self.systemd_units and self.systemd_units[state]:
+            card.append(f'<TR><TD BGCOLOR="{systemd_color}" COLSPAN="2"><B>Systemd Units</B></TD></TR>')
+            for unit in sorted(self.systemd_units[state]):
+                card.append(f'<TR><TD COLSPAN="2" ALIGN="LEFT">{_sanitize_html(unit)}</TD></TR>')
+
+        # Close the card table
+        card.append('</TABLE>')
+        return ''.join(card)
+
+
+def _sanitize_html(text):
+    """Sanitize text to be used in HTML-like labels"""
+    # Escape HTML special characters
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def _page_source(cards):
+    """Build the dot source of a page laying out cards in a grid"""
+    import graphviz
+    dot = graphviz.Digraph(
+        comment='SaltStack State Visualization',
+        engine='dot',
+        node_attr={
+            'shape': 'plaintext',
+            'fontname': 'Arial',
+        },
+        graph_attr={
+            'rankdir': 'TB',
+            'ranksep': '0.5',
+            'nodesep': '0.5',
+        }
+    )
+
+    # Create a main table for the entire layout
+    label = ['<<TABLE BORDER="0" CELLBORDER="0" CELLSPACING="10" CELLPADDING="10">']
+    for row in range(0, len(cards), CARDS_PER_ROW):
+        label.append('<TR>')
+        for card in cards[row:row + CARDS_PER_ROW]:
+            label.append(f'<TD>{card}</TD>')
+        # Empty cells for padding
+        label.append('<TD></TD>' * (CARDS_PER_ROW - len(cards[row:row + CARDS_PER_ROW])))
+        label.append('</TR>')
+    label.append('</TABLE>>')
+
+    # Create a single node with the entire HTML table
+    dot.node('salt_states', label=''.join(label), shape='plaintext')
+    return dot.source
+
+
+def _render_page(job):
+    """Lay out and render a single page with dot
+
+    Args:
+        job: Tuple of (dot source, format)
+
+    Returns:
+        The rendered page
+    """
+    import graphviz
+    source, format = job
+    return graphviz.Source(source).pipe(format=format)
+
+
+def _write_atomic(path, data):
+    """Replace a file atomically so readers never see a partial write"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_page_index(base, format, pages, rendered):
+    """Write rendered pages to <base>_pages/ and an HTML index embedding them
+
+    Returns:
+        Path to the index
+    """
+    pages_dir = f"{base}_pages"
+    os.makedirs(pages_dir, exist_ok=True)
+    page_names = [f"page-{idx + 1:03d}.{format}" for idx in range(len(pages))]
+    for name, data in zip(page_names, rendered):
+        _write_atomic(os.path.join(pages_dir, name), data)
+    # Drop pages left over from an earlier run with more pages
+    for name in os.listdir(pages_dir):
+        if name.startswith('page-') and name.endswith(f".{format}") and name not in page_names:
+            os.remove(os.path.join(pages_dir, name))
+
+    rel_dir = os.path.basename(pages_dir)
+    embed = format in ('svg', 'png', 'jpg', 'jpeg', 'gif')
+    html = [
+        '<!DOCTYPE html>',
+        '<html><head><meta charset="utf-8"><title>SaltStack State Visualization</title>',
+        '<style>body{font-family:Arial,sans-serif}nav a{margin-right:1em}section{margin:2em 0}</style>',
+        '</head><body>',
+        '<h1>SaltStack State Visualization</h1>',
+        '<nav>',
+    ]
+    for idx, page in enumerate(pages):
+        html.append(f'<a href="#page-{idx + 1}">{_sanitize_html(page[0])} &ndash; {_sanitize_html(page[-1])}</a>')
+    html.append('</nav>')
+    for idx, (page, name) in enumerate(zip(pages, page_names)):
+        src = f"{rel_dir}/{name}"
+        html.append(f'<section id="page-{idx + 1}"><h2>{_sanitize_html(page[0])} &ndash; {_sanitize_html(page[-1])}</h2>')
+        if embed:
+            html.append(f'<img src="{src}" alt="page {idx + 1}" loading="lazy">')
+        else:
+            html.append(f'<a href="{src}">{name}</a>')
+        html.append('</section>')
+    html.append('</body></html>')
+
+    index_path = f"{base}.html"
+    _write_atomic(index_path, '\n'.join(html).encode('utf-8'))
+    return index_path
+
+
+class RenderCache:
+    """On-disk cache of rendered pages keyed by a hash of their dot source and format"""
+
+    # Entries not used for this long are removed by prune()
+    MAX_AGE = 7 * 24 * 3600
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, 'render')
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source, format):
+        """Cache key of a page"""
+        return hashlib.sha1(f"{format}\0{source}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the rendered page stored under key, or None"""
+        path = os.path.join(self.path, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        # Mark the entry as used so prune() keeps it
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store a rendered page"""
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            _write_atomic(os.path.join(self.path, key), data)
+        except OSError as e:
+            print(f"Warning: could not write render cache {self.path}: {e}", file=sys.stderr)
+
+    def prune(self):
+        """Remove entries that have not been used recently"""
+        cutoff = time.time() - self.MAX_AGE
+        try:
+            entries = list(os.scandir(self.path))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class StateGraph:
+    """Indexes over the facts of a parsed salt tree for change-impact queries
+
+    Holds forward and reverse include adjacency, reverse indexes from pillar keys,
+    roles and systemd units to the states using them, and memoized transitive
+    include closures. Include cycles are handled by computing closures per
+    strongly connected component. A file include (a.b.c for a/b/c.sls) is an
+    edge to the state owning the file, as resolved by resolve_state().
+    """
+
+    def __init__(self, visualizer):
+        self.states = list(visualizer.states)
+        self.includes = defaultdict(set)
+        self.included_by = defaultdict(set)
+        self.states_by_pillar = defaultdict(set)
+        self.states_by_role = defaultdict(set)
+        self.states_by_role_dependency = defaultdict(set)
+        self.states_by_unit = defaultdict(set)
+
+        resolved = {}
+        for state, includes in visualizer.includes.items():
+            for include in includes:
+                if include not in resolved:
+                    # Includes that resolve to no state are kept under their own name
+                    resolved[include] = visualizer.resolve_state(include)[0] or include
+                target = resolved[include]
+                # Including one of its own files is no dependency on another state
+                if target == state:
+                    continue
+                self.includes[state].add(target)
+                self.included_by[target].add(state)
+        for state, pillars in visualizer.pillar_dependencies.items():
+            for pillar in pillars:
+                self.states_by_pillar[pillar].add(state)
+        for state, roles in visualizer.roles.items():
+            for role in roles:
+                self.states_by_role[role].add(state)
+        for state, roles in visualizer.role_dependencies.items():
+            for role in roles:
+                self.states_by_role_dependency[role].add(state)
+        for state, units in visualizer.systemd_units.items():
+            for unit in units:
+                self.states_by_unit[unit].add(state)
+
+        self._closures = {}
+        self._reverse_closures = {}
+
+    def closure(self, state):
+        """All states included by state, directly or transitively"""
+        if state not in self._closures:
+            self._compute_closures(state, self.includes, self._closures)
+        return self._closures[state]
+
+    def reverse_closure(self, state):
+        """All states that include state, directly or transitively"""
+        if state not in self._reverse_closures:
+            self._compute_closures(state, self.included_by, self._reverse_closures)
+        return self._reverse_closures[state]
+
+    @staticmethod
+    def _compute_closures(root, edges, memo):
+        """Fill memo with the closures of every node reachable from root (iterative Tarjan)"""
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        counter = 0
+        work = [(root, iter(sorted(edges.get(root, ()))))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child in memo:
+                    continue
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(edges.get(child, ())))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                # node is the root of a strongly connected component, all successors
+                # outside of it are finished so the component shares one closure
+                component = set()
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.add(member)
+                    if member == node:
+                        break
+                reachable = set()
+                for member in component:
+                    for child in edges.get(member, ()):
+                        reachable.add(child)
+                        if child not in component:
+                            reachable |= memo[child]
+                closure = frozenset(reachable)
+                for member in component:
+                    memo[member] = closure
+
+    def cycles(self):
+        """Include cycles, as sorted lists of the states involved"""
+        found = []
+        for state in sorted(self.includes):
+            closure = self.closure(state)
+            if state in closure:
+                # Members of a cycle share their closure, report each cycle once
+                members = sorted(other for other in closure if state in self.closure(other))
+                if members[0] == state:
+                    found.append(members)
+        return found
+
+
+QUERIES = {
+    'who-uses-pillar': ('PILLAR', 'States reading a pillar key via salt.pillar.get'),
+    'who-has-role': ('ROLE', 'States defining a role'),
+    'who-needs-role': ('ROLE', 'States with a nodehasrole() dependency on a role'),
+    'who-manages': ('UNIT', 'States managing a systemd unit'),
+    'includes': ('STATE', 'States included directly by a state'),
+    'included-by': ('STATE', 'States that include a state directly'),
+    'closure': ('STATE', 'States included by a state, transitively'),
+    'impact': ('STATE', 'States that include a state, transitively (affected by a change to it)'),
+    'cycles': (None, 'Include cycles'),
+}
+
+
+def run_query(graph, query, arg=None):
+    """Answer a query against a StateGraph
+
+    Returns:
+        Sorted list of result lines
+    """
+    if query == 'who-uses-pillar':
+        return sorted(graph.states_by_pillar.get(arg, ()))
+    if query == 'who-has-role':
+        return sorted(graph.states_by_role.get(arg, ()))
+    if query == 'who-needs-role':
+        return sorted(graph.states_by_role_dependency.get(arg, ()))
+    if query == 'who-manages':
+        return sorted(graph.states_by_unit.get(arg, ()))
+    if query == 'includes':
+        return sorted(graph.includes.get(arg, ()))
+    if query == 'included-by':
+        return sorted(graph.included_by.get(arg, ()))
+    if query == 'closure':
+        return sorted(graph.closure(arg))
+    if query == 'impact':
+        return sorted(graph.reverse_closure(arg))
+    if query == 'cycles':
+        return [', '.join(cycle) for cycle in graph.cycles()]
+    raise ValueError(f"Unknown query {query}")
+
 
 def check_graphviz_installed():
     """Check if graphviz executables are installed"""
@@ -463,9 +1998,210 @@ def check_graphviz_installed():
     except (subprocess.SubprocessError, FileNotFoundError):
         return False
 
-def main():
-    parser = argparse.ArgumentParser(description='SaltStack State Visualizer')
+
+def add_parse_arguments(parser):
+    """Add the arguments controlling how the salt tree is parsed"""
     parser.add_argument('salt_path', help='Path to the SaltStack states directory')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of parallel parser and dot processes (0 = one per CPU, default: 1)')
+    parser.add_argument('--cache-dir', default='.saltviz-cache', help='Directory for the incremental parse cache (default: .saltviz-cache)')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the incremental parse cache')
+    parser.add_argument('--rev', help='Read the states at this git revision instead of the working tree')
+    parser.add_argument('--state', action='append', metavar='NAME', help='Only read this state and the states it includes, can be repeated')
+    parser.add_argument('--depth', type=int, metavar='K', help='Follow includes of --state at most K levels deep (default: all)')
+
+
+def load_visualizer(args, timings=None):
+    """Find and parse the states under args.salt_path, reporting progress on stderr"""
+    salt_path = args.salt_path
+    if not os.path.isdir(salt_path):
+        print(f"Error: {salt_path} is not a directory", file=sys.stderr)
+        sys.exit(1)
+
+    visualizer = SaltStateVisualizer(salt_path)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    def phase(name):
+        return timings.phase(name) if timings is not None else nullcontext()
+
+    if args.rev:
+        reader = GitRevisionReader(salt_path)
+        try:
+            with phase('parse'):
+                load_revision(visualizer, reader, args.rev, jobs)
+        finally:
+            reader.close()
+    elif args.state:
+        load_states(visualizer, args, jobs, timings)
+    else:
+        print(f"Finding whole states in {salt_path}...", file=sys.stderr)
+        with phase('discovery'):
+            states = visualizer.find_whole_states()
+        print(f"Found {len(states)} whole states", file=sys.stderr)
+
+        print(f"Parsing state files{f' with {jobs} jobs' if jobs > 1 else ''}...", file=sys.stderr)
+        cache = None if args.no_cache else ParseCache(args.cache_dir)
+        with phase('parse'):
+            visualizer.parse_state_files(jobs=jobs, cache=cache, timings=timings)
+            if cache is not None:
+                cache.save()
+        if cache is not None:
+            print(f"Parse cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+
+    if timings is not None:
+        timings.counters.update({f"yaml.{outcome}": count for outcome, count in visualizer.yaml_stats.items()})
+        timings.fact_store = visualizer.facts.memory_footprint()
+    if visualizer.yaml_stats:
+        stats = visualizer.yaml_stats
+        # Only name the loader when YAML was loaded, naming it imports PyYAML
+        loader = yaml_loader()[1] if stats[YAML_PARSED] or stats[YAML_FAILED] else 'not loaded'
+        print(f"YAML ({loader}): {stats[YAML_PARSED]} parsed, {stats[YAML_FAILED]} failed, "
+              f"{stats[YAML_SKIPPED_NO_TARGETS]} skipped (no service/systemd states), "
+              f"{stats[YAML_SKIPPED_JINJA]} skipped (Jinja)", file=sys.stderr)
+    return visualizer
+
+
+def load_states(visualizer, args, jobs, timings=None):
+    """Parse only the --state states and their include closure into visualizer"""
+    depth = '' if args.depth is None else f" up to {args.depth} level{'s' if args.depth != 1 else ''} deep"
+    print(f"Reading {', '.join(args.state)} and {'its' if len(args.state) == 1 else 'their'} includes{depth}...",
+          file=sys.stderr)
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    with timings.phase('parse') if timings is not None else nullcontext():
+        missing, unresolved = visualizer.load_states(args.state, depth=args.depth, jobs=jobs, cache=cache,
+                                                     timings=timings)
+        if cache is not None:
+            # Only part of the tree was looked at, keep the entries of the rest
+            cache.save(prune=False)
+    for name in missing:
+        print(f"Warning: {name} is not a state under {visualizer.salt_path}", file=sys.stderr)
+    if len(missing) == len(args.state):
+        print("Error: none of the requested states were found", file=sys.stderr)
+        sys.exit(1)
+    if unresolved:
+        print(f"Warning: {len(unresolved)} includes could not be resolved: {', '.join(unresolved)}", file=sys.stderr)
+    print(f"Parsed {len(visualizer.file_facts)} files of {len(visualizer.states)} states", file=sys.stderr)
+    if cache is not None:
+        print(f"Parse cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+
+
+def load_revision(visualizer, reader, rev, jobs, blob_facts=None):
+    """Parse the states of a git revision into visualizer, reporting progress on stderr"""
+    print(f"Reading states of {visualizer.salt_path} at {rev}...", file=sys.stderr)
+    try:
+        parsed = visualizer.load_revision(reader, rev, jobs=jobs, blob_facts=blob_facts)
+    except (ValueError, OSError) as e:
+        print(f"Error reading revision {rev}: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Found {len(visualizer.states)} whole states, parsed {parsed} of {len(visualizer.file_facts)} files",
+          file=sys.stderr)
+
+
+# Fact kinds compared by --diff: (key, title, visualizer attribute)
+DIFF_KINDS = [
+    ('roles', 'Roles', 'roles'),
+    ('role_dependencies', 'Role Dependencies', 'role_dependencies'),
+    ('pillars', 'Pillar Dependencies', 'pillar_dependencies'),
+    ('systemd_units', 'Systemd Units', 'systemd_units'),
+    ('includes', 'Dependencies', 'includes'),
+]
+
+
+def diff_states(old, new, kinds):
+    """Compare the facts of two parsed trees
+
+    Args:
+        old: SaltStateVisualizer of the old revision
+        new: SaltStateVisualizer of the new revision
+        kinds: Keys of the DIFF_KINDS to compare
+
+    Returns:
+        List of {'state', 'status', 'changes'} records for the states that differ,
+        sorted by state; changes maps a kind to its sorted 'added' and 'removed' values
+    """
+    old_states, new_states = set(old.states), set(new.states)
+    records = []
+    for state in sorted(old_states | new_states):
+        changes = {}
+        for key, _, attr in DIFF_KINDS:
+            if key not in kinds:
+                continue
+            before = set(getattr(old, attr).get(state, ()))
+            after = set(getattr(new, attr).get(state, ()))
+            if before != after:
+                changes[key] = {'added': sorted(after - before), 'removed': sorted(before - after)}
+        if state not in old_states:
+            status = 'added'
+        elif state not in new_states:
+            status = 'removed'
+        elif changes:
+            status = 'changed'
+        else:
+            continue
+        records.append({'state': state, 'status': status, 'changes': changes})
+    return records
+
+
+def iter_diff_report(records, rev_a, rev_b):
+    """Generate the lines of a human-readable --diff report"""
+    yield "=" * 80
+    yield f"SaltStack State Changes: {rev_a} -> {rev_b}"
+    yield "=" * 80
+    yield ""
+    markers = {'added': '+', 'removed': '-', 'changed': '~'}
+    for record in records:
+        yield f"{markers[record['status']]} State: {record['state']} ({record['status']})"
+        for key, title, _ in DIFF_KINDS:
+            change = record['changes'].get(key)
+            if change is None:
+                continue
+            yield f"  {title}:"
+            for value in change['added']:
+                yield f"    + {value}"
+            for value in change['removed']:
+                yield f"    - {value}"
+        yield ""
+    counts = Counter(record['status'] for record in records)
+    yield "=" * 80
+    yield f"States: {counts['added']} added, {counts['removed']} removed, {counts['changed']} changed"
+    yield "=" * 80
+
+
+def query_main(argv):
+    """Entry point of the query subcommand"""
+    parser = argparse.ArgumentParser(
+        prog='salt_state_visualizer.py query',
+        description='Answer change-impact questions about a SaltStack tree',
+        epilog='queries:\n' + '\n'.join(
+            f"  {(name + ' ' + (arg or '')):<24} {help_text}" for name, (arg, help_text) in QUERIES.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_parse_arguments(parser)
+    parser.add_argument('query', choices=sorted(QUERIES), metavar='QUERY', help='Query to run (see below)')
+    parser.add_argument('arg', nargs='?', help='Pillar key, role, unit or state the query is about')
+    args = parser.parse_args(argv)
+
+    arg_name = QUERIES[args.query][0]
+    if arg_name and args.arg is None:
+        parser.error(f"{args.query} requires a {arg_name} argument")
+    if args.state and args.rev:
+        parser.error("--state reads the working tree and cannot be combined with --rev")
+
+    visualizer = load_visualizer(args)
+    results = run_query(StateGraph(visualizer), args.query, args.arg)
+    for line in results:
+        print(line)
+    # Like grep, exit with 1 when nothing matched
+    sys.exit(0 if results else 1)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        query_main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        description='SaltStack State Visualizer',
+        epilog="Run '%(prog)s query -h' for change-impact queries (who-uses-pillar, closure, who-manages, ...)")
+    add_parse_arguments(parser)
     parser.add_argument('-o', '--output', help='Output file path (default: stdout)')
     parser.add_argument('-p', '--pillars', action='store_true', help='Include pillar dependencies in the output')
     parser.add_argument('-r', '--roles', action='store_true', help='Include role dependencies in the output')
@@ -473,28 +2209,125 @@ def main():
     parser.add_argument('--no-roles', action='store_true', help='Exclude role dependencies from the output')
     parser.add_argument('--no-systemd', action='store_true', help='Exclude systemd units from the output')
     parser.add_argument('-g', '--graphical', action='store_true', help='Generate graphical output (SVG) instead of ASCII')
-    parser.add_argument('-f', '--format', default='svg', help='Output format for graphical output (svg, png, pdf, etc.)')
+    parser.add_argument('-f', '--format', help='Output format: svg, png, pdf, etc. with -g (default: svg), '
+                                                'otherwise text, json or ndjson (default: text)')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='Split the graph into pages of this many state cards, 1 renders one card per state (default: 0 = a single page)')
+    parser.add_argument('-w', '--watch', action='store_true', help='Keep running and re-render the output when state files change')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Polling interval in seconds when inotify is unavailable (default: 1.0)')
+    parser.add_argument('--timings', choices=['text', 'json'], help='Report per-phase wall/CPU time, the slowest files and match counters in this format')
+    parser.add_argument('--timings-file', help='Write the --timings report to this file (default: stderr)')
+    parser.add_argument('--top-files', type=int, default=10, help='Number of slowest files in the --timings report (default: 10)')
+    parser.add_argument('--profile', metavar='FILE', help='Run under cProfile and dump the pstats data to FILE')
+    parser.add_argument('--diff', nargs=2, metavar=('REV_A', 'REV_B'), help='Report the roles, pillars, units and includes added or removed per state between two git revisions')
     args = parser.parse_args()
-    
-    salt_path = args.salt_path
-    if not os.path.isdir(salt_path):
-        print(f"Error: {salt_path} is not a directory", file=sys.stderr)
+    if args.watch and (args.rev or args.diff):
+        parser.error("--watch reads the working tree and cannot be combined with --rev or --diff")
+    if args.state and (args.rev or args.diff or args.watch):
+        parser.error("--state cannot be combined with --rev, --diff or --watch")
+
+    timings = Timings() if args.timings else None
+    profiler = None
+    if args.profile:
+        if args.jobs != 1:
+            print("Warning: --profile only covers the main process, parser and dot workers are not profiled", file=sys.stderr)
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        if args.diff:
+            ok = write_diff(args, timings=timings)
+        elif args.watch:
+            watch(load_visualizer(args, timings=timings), args)
+            ok = True
+        else:
+            ok = write_output(load_visualizer(args, timings=timings), args, timings=timings)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"Profile written to {args.profile}, the most expensive calls were:", file=sys.stderr)
+            import pstats
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(15)
+
+    if timings is not None:
+        write_timings(timings, args)
+    if not ok:
         sys.exit(1)
-    
-    visualizer = SaltStateVisualizer(salt_path)
-    
-    print(f"Finding whole states in {salt_path}...", file=sys.stderr)
-    states = visualizer.find_whole_states()
-    print(f"Found {len(states)} whole states", file=sys.stderr)
-    
-    print("Parsing state files...", file=sys.stderr)
-    visualizer.parse_state_files()
-    
+
+
+def write_timings(timings, args):
+    """Write the --timings report to stderr or --timings-file"""
+    if args.timings == 'json':
+        report = json.dumps(timings.to_dict(top=args.top_files), indent=2)
+    else:
+        report = "\n".join(timings.format(top=args.top_files))
+    if args.timings_file:
+        with open(args.timings_file, 'w') as f:
+            f.write(report + "\n")
+        print(f"Timings written to {args.timings_file}", file=sys.stderr)
+    else:
+        print(report, file=sys.stderr)
+
+
+def write_diff(args, timings=None):
+    """Compare the states of the two --diff revisions and write the report
+
+    Both revisions are read through one git cat-file process and every blob is
+    parsed once, so only files that differ between them are parsed twice.
+
+    Returns:
+        False if the output could not be written
+    """
+    rev_a, rev_b = args.diff
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    reader = GitRevisionReader(args.salt_path)
+    blob_facts = {}
+    try:
+        with timings.phase('parse') if timings is not None else nullcontext():
+            old = SaltStateVisualizer(args.salt_path)
+            load_revision(old, reader, rev_a, jobs, blob_facts)
+            new = SaltStateVisualizer(args.salt_path)
+            load_revision(new, reader, rev_b, jobs, blob_facts)
+    finally:
+        reader.close()
+
+    kinds = {'roles', 'includes'}
+    if not args.no_roles:
+        kinds.add('role_dependencies')
+    if not args.no_pillars:
+        kinds.add('pillars')
+    if not args.no_systemd:
+        kinds.add('systemd_units')
+    records = diff_states(old, new, kinds)
+
+    if args.format in ('json', 'ndjson'):
+        if args.format == 'ndjson':
+            lines = (json.dumps(record, sort_keys=True) for record in records)
+        else:
+            lines = [json.dumps({'from': rev_a, 'to': rev_b, 'states': records}, sort_keys=True)]
+        return stream_output(lines, args.output, terminate=True)
+    return stream_output(iter_diff_report(records, rev_a, rev_b), args.output)
+
+
+def write_output(visualizer, args, timings=None):
+    """Render the visualization selected on the command line
+
+    Returns:
+        False if the output could not be written
+    """
+    if timings is None:
+        return _write_output(visualizer, args)
+    with timings.phase('render'):
+        return _write_output(visualizer, args, timings)
+
+
+def _write_output(visualizer, args, timings=None):
     # Process command line flags
     show_pillars = not args.no_pillars
     show_roles = not args.no_roles
     show_systemd = not args.no_systemd
-    
+
     # Determine output type and generate appropriate visualization
     if args.graphical:
         # Check if graphviz is installed
@@ -504,41 +2337,117 @@ def main():
             print("On CentOS/RHEL: sudo yum install graphviz", file=sys.stderr)
             print("On macOS: brew install graphviz", file=sys.stderr)
             print("Falling back to ASCII output...", file=sys.stderr)
-            args.graphical = False
         else:
             output_file = args.output
             if output_file and '.' in output_file:
                 # Strip extension if present as graphviz will add it
                 output_file = os.path.splitext(output_file)[0]
-                
-            print(f"Generating graphical visualization in {args.format} format...", file=sys.stderr)
+
+            format = args.format or 'svg'
+            print(f"Generating graphical visualization in {format} format...", file=sys.stderr)
+            cache = None if args.no_cache else RenderCache(args.cache_dir)
             try:
                 output_path = visualizer.generate_graphviz(
                     output_file=output_file,
                     show_pillars=show_pillars,
                     show_roles=show_roles,
                     show_systemd=show_systemd,
-                    format=args.format
+                    format=format,
+                    page_size=args.page_size,
+                    jobs=args.jobs if args.jobs > 0 else (os.cpu_count() or 1),
+                    cache=cache,
+                    timings=timings
                 )
+                if cache is not None:
+                    cache.prune()
+                    print(f"Render cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
                 print(f"Graphical visualization written to {output_path}", file=sys.stderr)
-                return
+                return True
             except Exception as e:
                 print(f"Error generating graphical output: {e}", file=sys.stderr)
                 print("Falling back to ASCII output...", file=sys.stderr)
+
+    export = args.format in ('json', 'ndjson') and not args.graphical
+    if export:
+        print(f"Generating {args.format.upper()} export...", file=sys.stderr)
+        lines = visualizer.iter_json(show_pillars=show_pillars, show_roles=show_roles, show_systemd=show_systemd,
+                                     ndjson=args.format == 'ndjson')
     else:
         print("Generating ASCII diagram...", file=sys.stderr)
-        diagram = visualizer.generate_ascii_diagram(show_pillars=show_pillars, show_roles=show_roles)
-        
-        if args.output:
+        lines = visualizer.iter_ascii_diagram(show_pillars=show_pillars, show_roles=show_roles)
+
+    return stream_output(lines, args.output, terminate=export)
+
+
+def stream_output(lines, output=None, terminate=False):
+    """Stream lines to the output file, or stdout
+
+    Args:
+        terminate: End a file with a newline (stdout always gets one)
+
+    Returns:
+        False if the output could not be written
+    """
+    if output:
+        # Replace the file atomically so readers never see a partial diagram
+        tmp_path = f"{output}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                write_lines(f, lines)
+                if terminate:
+                    f.write("\n")
+            os.replace(tmp_path, output)
+            print(f"Diagram written to {output}", file=sys.stderr)
+        except Exception as e:
+            print(f"Error writing to {output}: {e}", file=sys.stderr)
             try:
-                with open(args.output, 'w') as f:
-                    f.write(diagram)
-                print(f"Diagram written to {args.output}", file=sys.stderr)
-            except Exception as e:
-                print(f"Error writing to {args.output}: {e}", file=sys.stderr)
-                sys.exit(1)
-        else:
-            print(diagram)
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+    else:
+        try:
+            write_lines(sys.stdout, lines)
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader went away (e.g. | head). Point stdout at devnull so the
+            # flush at interpreter exit does not fail again, and stop quietly.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+    return True
+
+
+def write_lines(out, lines):
+    """Stream lines to out as they are generated, without a trailing newline"""
+    separator = ""
+    for line in lines:
+        out.write(separator)
+        out.write(line)
+        separator = "\n"
+
+
+def watch(visualizer, args):
+    """Re-render the output whenever state files change, until interrupted"""
+    write_output(visualizer, args)
+    watcher = create_watcher(visualizer.salt_path, interval=args.poll_interval)
+    print(f"Watching {visualizer.salt_path} for changes ({type(watcher).__name__}), Ctrl-C to stop", file=sys.stderr)
+    try:
+        while True:
+            change = watcher.poll(timeout=60)
+            if change is None:
+                continue
+            touched, structural = change
+            start = time.perf_counter()
+            states = visualizer.apply_changes(touched=touched, reindex=structural)
+            parse_ms = (time.perf_counter() - start) * 1000
+            print(f"Updated {len(states)} states in {parse_ms:.1f} ms", file=sys.stderr)
+            write_output(visualizer, args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
 
 if __name__ == "__main__":
     main()